@@ -6,9 +6,12 @@ NOTE (11/27/2024): the ACP period needs to match the reqeust period
 '''
 
 from enum import Enum, auto
+from collections import Counter
+from heapq import heappush, heappop
 from itertools import accumulate
 from bisect import bisect_left
 from typing import TYPE_CHECKING, Optional
+import numpy as np
 
 from sequence.message import Message
 from sequence.protocol import Protocol
@@ -22,11 +25,14 @@ from sequence.network_management.reservation import Reservation
 
 from purification import BBPSSW_bds
 from reservation import ResourceReservationProtocolAdaptive, ReservationAdaptive
+from entanglement_pair import EntanglementPairInventory
+from ticker import Ticker
 
 if TYPE_CHECKING:
     from sequence.resource_management.rule_manager import Rule
     from node import QuantumRouterAdaptive
     from resource_manager import ResourceManagerAdaptive
+    from sequence.kernel.timeline import Timeline
 
 
 class ACMsgType(Enum):
@@ -50,27 +56,258 @@ class AdaptiveContinuousMessage(Message):
     def __init__(self, msg_type: ACMsgType, reservation: ReservationAdaptive, **kwargs):
         super().__init__(msg_type, receiver='adaptive_continuous')
         self.reservation = reservation
-        self.string = f'type={msg_type.name}, reservation={reservation}'
 
         if self.msg_type == ACMsgType.RESPOND:
             self.answer = kwargs['answer']
-            self.string += ', answer={}'.format(self.answer)
             if self.answer == True:
                 self.path = kwargs['path']
-                self.string += f', path={self.path}'
+                self.memory_size = kwargs['memory_size']  # the number of memories the responder accepted
         
         elif self.msg_type == ACMsgType.CACHE:        # for updating the probability table
             self.timestamp = kwargs['timestamp']
-            self.string += f', timestamp={self.timestamp}'
 
         elif self.msg_type == ACMsgType.INFORM_EP:
             self.selected_ep = kwargs['selected_ep']
             self.rule = kwargs['rule']
-            self.string += f', selected_ep={self.selected_ep}'
-            # self.string += f', selected_ep={self.selected_ep}, rule={self.rule}'
 
     def __str__(self):
-        return f'|{self.string}|'
+        '''the string is built only when needed (e.g., logging), not for every message
+        '''
+        string = f'type={self.msg_type.name}, reservation={self.reservation}'
+        if self.msg_type == ACMsgType.RESPOND:
+            string += f', answer={self.answer}'
+            if self.answer == True:
+                string += f', path={self.path}, memory_size={self.memory_size}'
+        elif self.msg_type == ACMsgType.CACHE:
+            string += f', timestamp={self.timestamp}'
+        elif self.msg_type == ACMsgType.INFORM_EP:
+            string += f', selected_ep={self.selected_ep}'
+        return f'|{string}|'
+
+
+class PathCache:
+    '''The history of entanglement paths that go through a node within a sliding time window.
+       Keeps a counter of how many paths in the window have each neighbor next to the node,
+       the counter is updated when a path is added and when a path is evicted
+
+    Attributes:
+        node_name (str): the name of the node that owns the cache
+        window (int): paths whose timestamp is older than (latest timestamp - window) are evicted
+        paths (list): a heap of (timestamp, counter, neighbors), where neighbors is a tuple of the node's neighbors in the path
+        neighbor_count (Counter): neighbor name -> number of paths in the window that the neighbor is next to this node
+    '''
+    def __init__(self, node_name: str, window: int):
+        self.node_name = node_name
+        self.window = window
+        self.paths = []
+        self.neighbor_count = Counter()
+        self.counter = 0  # tie breaker for paths with the same timestamp
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def add(self, timestamp: int, path: list) -> tuple:
+        '''add an entanglement path
+
+        Args:
+            timestamp: the time when the entanglement path is generated
+            path: a list of node names
+        Return:
+            tuple: the neighbors of the node in the path
+        '''
+        neighbors = []
+        if self.node_name in path:
+            this_index = path.index(self.node_name)
+            if this_index >= 1:
+                neighbors.append(path[this_index - 1])
+            if this_index <= len(path) - 2:
+                neighbors.append(path[this_index + 1])
+        neighbors = tuple(set(neighbors))
+        heappush(self.paths, (timestamp, self.counter, neighbors))
+        self.counter += 1
+        self.neighbor_count.update(neighbors)
+        self.evict(timestamp - self.window)
+        return neighbors
+
+    def evict(self, time: int) -> None:
+        '''evict the paths whose timestamp is smaller than time
+
+        Args:
+            time: the left end of the time window
+        '''
+        while self.paths and self.paths[0][0] < time:
+            _, _, neighbors = heappop(self.paths)
+            for neighbor in neighbors:
+                self.neighbor_count[neighbor] -= 1
+                if self.neighbor_count[neighbor] == 0:
+                    del self.neighbor_count[neighbor]
+
+    def get_neighbors(self) -> set:
+        '''return the neighbors that are next to this node in at least one entanglement path in the window
+        '''
+        return set(self.neighbor_count)
+
+
+class ProbabilityTableEngine:
+    '''Keep the probability tables of all the routers as one matrix (router x neighbor slot),
+       and update the tables of all the routers in one batched operation per period.
+       It replaces the update_probability_table_event of each router.
+       The engine keeps its own window of the entanglement paths, as the number of paths in the window that have each (router, neighbor slot),
+       so an update only pops the paths that are out of the window, then works on whole arrays.
+       The dict form of a table is only built when get_probability_table() is called.
+
+       Note: the engine targets the distributed AdaptiveContinuousProtocol (QuantumRouterAdaptive).
+       The centralized QuantumRouterAdaptiveWorker does not update its own table, the controller sends it.
+
+       Usage: create one engine per network, set router.adaptive_continuous.engine = engine for every router before timeline.init().
+       The engine reads update_prob, has_empty_neighbor and print_prob_table when a protocol is added, so set them before timeline.init() as well.
+       If the routers have a ticker, the engine's update runs on the ticker instead of its own tick events
+
+    Attributes:
+        timeline (Timeline): the simulation timeline
+        period (int): the period (ps) of the update, should be equal to the period of the adaptive continuous protocols
+        delta (float): the increase of the probability of a neighbor that is in an entanglement path
+        protocols (list): the registered adaptive continuous protocols, the index is the row of the matrix
+        slots (list): for each row, the sorted neighbor names (including '' as no neighbor)
+        slot_index (list): for each row, a dict of neighbor name -> slot
+        empty_slot (np.ndarray): for each row, the slot of '', -1 if there is no ''
+        update_prob (np.ndarray): for each row, whether to update the probability table
+        has_empty_neighbor (np.ndarray): for each row, whether the probability table has empty neighbor
+        print_rows (list): the rows that print their probability table after each update
+        matrix (np.ndarray): the probability tables, padded with zeros
+        cdf (np.ndarray): the accumulated probability tables, i.e., the roulette wheels
+        hit_count (np.ndarray): the number of entanglement paths in the window that have the neighbor slot next to the router
+        paths (list): a heap of (timestamp, counter, row, slots), the entanglement paths in the window
+        update_count (int): the number of ticks
+    '''
+    def __init__(self, timeline: "Timeline", period: int, delta: float = 0.05):
+        self.timeline = timeline
+        self.period = period
+        self.delta = delta
+        self.protocols = []
+        self.slots = []
+        self.slot_index = []
+        self.empty_slot = np.zeros(0, dtype=int)
+        self.update_prob = np.zeros(0, dtype=bool)
+        self.has_empty_neighbor = np.zeros(0, dtype=bool)
+        self.print_rows = []
+        self.matrix = np.zeros((0, 0))
+        self.cdf = np.zeros((0, 0))
+        self.hit_count = np.zeros((0, 0), dtype=int)
+        self.paths = []
+        self.counter = 0  # tie breaker for paths with the same timestamp
+        self.update_count = 0
+
+    def add(self, protocol: "AdaptiveContinuousProtocol") -> None:
+        '''add the protocol (with an initialized probability table) as a new row, and start the ticks when the first protocol is added
+        '''
+        assert protocol.period == self.period, f'{protocol.owner.name} period={protocol.period} does not match the engine period={self.period}'
+        row = len(self.protocols)
+        protocol.engine_row = row
+        slots = sorted(protocol.probability_table)
+        self.protocols.append(protocol)
+        self.slots.append(slots)
+        self.slot_index.append({neighbor: slot for slot, neighbor in enumerate(slots)})
+        self.empty_slot = np.append(self.empty_slot, slots.index('') if '' in slots else -1)
+        self.update_prob = np.append(self.update_prob, protocol.update_prob)
+        self.has_empty_neighbor = np.append(self.has_empty_neighbor, protocol.has_empty_neighbor)
+        if protocol.print_prob_table:
+            self.print_rows.append(row)
+
+        width = max(self.matrix.shape[1], len(slots))
+        matrix = np.zeros((row + 1, width))
+        matrix[:row, :self.matrix.shape[1]] = self.matrix
+        matrix[row, :len(slots)] = [protocol.probability_table[neighbor] for neighbor in slots]
+        self.matrix = matrix
+        self.cdf = np.cumsum(self.matrix, axis=1)
+        hit_count = np.zeros((row + 1, width), dtype=int)
+        hit_count[:row, :self.hit_count.shape[1]] = self.hit_count
+        self.hit_count = hit_count
+
+        if row == 0:
+            if protocol.ticker is not None:
+                process = Process(self, 'update', [])
+                protocol.ticker.register(process, self.timeline.now(), self.period)
+            else:
+                self.tick()
+
+    def add_path(self, row: int, timestamp: int, neighbors: tuple) -> None:
+        '''add an entanglement path to the window
+
+        Args:
+            row: the row of the router that received the path
+            timestamp: the time when the entanglement path is generated
+            neighbors: the router's neighbors in the path, returned by PathCache.add()
+        '''
+        slot_index = self.slot_index[row]
+        slots = [slot_index[neighbor] for neighbor in neighbors if neighbor != '' and neighbor in slot_index]
+        heappush(self.paths, (timestamp, self.counter, row, slots))
+        self.counter += 1
+        self.hit_count[row, slots] += 1
+
+    def tick(self) -> None:
+        '''update all the probability tables, then schedule the next tick
+        '''
+        self.update()
+        process = Process(self, 'tick', [])
+        event = Event(self.timeline.now() + self.period, process)
+        self.timeline.schedule(event)
+
+    def update(self) -> None:
+        '''the batched version of AdaptiveContinuousProtocol.update_probability_table
+        '''
+        if self.update_count == 0:
+            self.update_count += 1
+            return
+        # 1. evict the entanglement paths that are out of the window
+        window_start = self.timeline.now() - self.period
+        while self.paths and self.paths[0][0] < window_start:
+            _, _, row, slots = heappop(self.paths)
+            self.hit_count[row, slots] -= 1
+        # 2. the neighbors in the paths, rows without any neighbor in the paths increase the probability of no neighbor
+        active = self.update_prob
+        hit = self.hit_count > 0
+        no_hit = active & ~hit.any(axis=1) & self.has_empty_neighbor & (self.empty_slot >= 0)
+        hit[no_hit, self.empty_slot[no_hit]] = True
+        # 3. increase and normalize
+        self.matrix[active] += self.delta * hit[active]
+        self.matrix[active] /= self.matrix[active].sum(axis=1, keepdims=True)
+        self.cdf = np.cumsum(self.matrix, axis=1)
+
+        for row in self.print_rows:
+            if active[row]:
+                print_probability_table(self.protocols[row].owner.name, self.update_count, self.get_probability_table(row))
+        self.update_count += 1
+
+    def sample(self, row: int, random_number: float) -> str:
+        '''roulette wheel selection on a row
+
+        Args:
+            row: the row of the router
+            random_number: uniform random number in [0, 1)
+        Return:
+            str: the name of the selected neighbor
+        '''
+        slots = self.slots[row]
+        index = int(np.searchsorted(self.cdf[row], random_number, side='left'))
+        return slots[min(index, len(slots) - 1)]
+
+    def get_probability_table(self, row: int) -> dict:
+        '''return the probability table of a row as a dict, neighbor name -> probability
+        '''
+        return {neighbor: float(self.matrix[row, slot]) for slot, neighbor in enumerate(self.slots[row])}
+
+
+def print_probability_table(node_name: str, update_count: int, probability_table: dict) -> None:
+    '''print a probability table in one line, the empty neighbor is printed as None
+    '''
+    print(f'{node_name}, {update_count}, ', end = '')
+    for node, prob in probability_table.items():
+        if node != '':
+            print(f'{node}: {prob:.4}', end = ' ')
+        else:
+            print(f'None: {prob:.4}', end = ' ')
+    print()
 
 
 class AdaptiveContinuousProtocol(Protocol):
@@ -84,10 +321,15 @@ class AdaptiveContinuousProtocol(Protocol):
         adaptive_memory_used (int): the number of memory that is currently used by the adaptive continuous protocol
         resource_reservation (ResourceReservationProtocolAdaptive): the resource reservation protocol
         probability_table (dict): str -> float, the probability that decides which neighbor is selected
-        generated_entanglement_pairs (set): each element is a tuple of (str, str), where each str is the name of the memory
-        cache (list): store the history of entanglement paths
+        generated_entanglement_pairs (EntanglementPairInventory): each element is a tuple of ((node_name, memory_name), (remote_node_name, remote_memory_name)), indexed by link and by memory name
+        cache (PathCache): store the history of entanglement paths within the last period
         update_prob (bool): whether update the probability table or not
         has_empty_neighbor (bool): whether the probability table has empty neighbor
+        engine (ProbabilityTableEngine): if not None, the probability table is kept and updated by the engine, use get_probability_table() to read it
+        engine_row (int): the row of this protocol in the engine
+        ticker (Ticker): if not None, the periodic update of the probability table is run by the shared ticker.
+                         RouterNetTopoAdaptive hands its ticker to the controller and the workers, set this one by hand when building QuantumRouterAdaptive.
+                         The ends of the AC reservations also run on the ticker
     '''
 
     def __init__(self, owner: "QuantumRouterAdaptive", name: str, adaptive_max_memory: int, resource_reservation: ResourceReservationProtocolAdaptive, period: int = SECOND):
@@ -96,9 +338,11 @@ class AdaptiveContinuousProtocol(Protocol):
         self.adaptive_memory_used = 0
         self.resource_reservation = resource_reservation
         self.probability_table = {}
+        self.sampler_neighbors = []   # the neighbors of the roulette wheel, sorted
+        self.sampler_accumulate = []  # the accumulated probabilities of the roulette wheel
         self.probability_table_update_count = 0
-        self.generated_entanglement_pairs = set()
-        self.cache = []  # each item is (timestamp: int, path: list)
+        self.generated_entanglement_pairs = EntanglementPairInventory()
+        self.cache = PathCache(owner.name, period)
         self.update_prob = True
         self.has_empty_neighbor = True
         self.strategy = "freshest"  # "random" or "freshest", for picking an entanglement pair given multiple entanglement pairs
@@ -107,15 +351,27 @@ class AdaptiveContinuousProtocol(Protocol):
         self.delay_no_memory = 0             # this node either reached adaptive_max_memory or no memory 
         self.delay_select_neighbor_none = 0  # this node selected none as neighbor
         self.delay_remote_response = 0       # neighbor has a response
+        self.waiting_for_memory = False      # the cycle is paused because adaptive_memory_used reached adaptive_max_memory
+        self.batch_size = 1                  # the maximum number of memories reserved with a neighbor in one cycle
+        self.engine: ProbabilityTableEngine = None
+        self.engine_row = -1
+        self.ticker: Ticker = None
         self.update_period(period)
 
 
     def init(self):
-        '''deal with the probability table
+        '''deal with the probability table, the periodic update runs on the engine, the ticker, or the protocol's own events (in this order)
+           These paths only exist in the distributed protocol, the centralized worker's table is updated by the controller's messages
         '''
         self.init_probability_table()
-        elapse = self.period
-        self.update_probability_table_event(elapse)
+        if self.engine is not None:
+            self.engine.add(self)   # the engine updates the probability table of all routers every period
+        elif self.ticker is not None:
+            process = Process(self, 'update_probability_table', [self.period])
+            self.ticker.register(process, self.owner.timeline.now(), self.period)
+        else:
+            elapse = self.period
+            self.update_probability_table_event(elapse)
 
     def update_period(self, period: int) -> None:
         '''update the period of ACP, and also update the delays
@@ -124,6 +380,7 @@ class AdaptiveContinuousProtocol(Protocol):
             period (int): time in ps
         '''
         self.period = period
+        self.cache.window = period
         self.delay_no_memory            = period // 1000
         self.delay_select_neighbor_none = period // 100
         self.delay_remote_response      = 3 * self.delay_no_memory
@@ -132,6 +389,7 @@ class AdaptiveContinuousProtocol(Protocol):
         '''set the max memory used for the adaptive continuousp protocol
         '''
         self.adaptive_max_memory = adaptive_max_memory
+        self.wakeup()
 
     def update_probability_table_event(self, elapse):
         self.update_probability_table(elapse)
@@ -144,7 +402,7 @@ class AdaptiveContinuousProtocol(Protocol):
         '''
         # check whether the adaptive protocol has used up its memory quota
         if self.adaptive_memory_used >= self.adaptive_max_memory:
-            self.start_delay(delay = self.delay_no_memory)  # schedule a start event in the future
+            self.waiting_for_memory = True  # the cycle is resumed by wakeup() when a memory is released
             return
 
         # select neighbor
@@ -154,23 +412,42 @@ class AdaptiveContinuousProtocol(Protocol):
             self.start_delay(delay = self.delay_select_neighbor_none)  # schedule a start event in the future
             return
 
-        log.logger.debug(f'{self.owner.name} selected neighbor {neighbor}, adaptive_memory_used is increased from {self.adaptive_memory_used} to {self.adaptive_memory_used + 1}')
-        self.adaptive_memory_used += 1
+        memory_size = min(self.batch_size, self.adaptive_max_memory - self.adaptive_memory_used)
         round_trip_time = self.owner.cchannels[neighbor].delay * 2
         start_time = self.owner.timeline.now() + round_trip_time    # consider a round trip time for the "handshaking"
         end_time = self.round_to_period(start_time + self.period)   # the 'period' is one second
         # set up reservation
-        reservation = ReservationAdaptive(self.owner.name, neighbor, start_time, end_time, memory_size=1, fidelity=0.9)
-        if self.resource_reservation.schedule(reservation):
+        reservation = ReservationAdaptive(self.owner.name, neighbor, start_time, end_time, memory_size=memory_size, fidelity=0.9)
+        if self.schedule_batch(reservation, memory_size):
             # able to schedule on current node, i.e., has memory
+            log.logger.debug(f'{self.owner.name} selected neighbor {neighbor}, adaptive_memory_used is increased from {self.adaptive_memory_used} to {self.adaptive_memory_used + reservation.memory_size}')
+            self.adaptive_memory_used += reservation.memory_size
             msg = AdaptiveContinuousMessage(ACMsgType.REQUEST, reservation)
             self.owner.send_message(neighbor, msg)
         else:
             # not able to schedule on current node (lack of memory), schedule another start event after 1 ms
-            self.adaptive_memory_used -= 1
             self.start_delay(delay = self.delay_no_memory)
 
 
+    def schedule_batch(self, reservation: ReservationAdaptive, memory_size: int) -> bool:
+        '''schedule the reservation on this node with as many memories as possible, at most memory_size
+
+        Args:
+            reservation: the reservation created by the adaptive continuous protocol
+            memory_size: the maximum number of memories
+        Return:
+            bool: True if at least one memory is scheduled, then reservation.memory_size is set to the number of scheduled memories.
+                  False if no memory is scheduled, then reservation.memory_size is not changed
+        '''
+        requested_memory_size = reservation.memory_size
+        for size in range(memory_size, 0, -1):
+            reservation.memory_size = size
+            if self.resource_reservation.schedule(reservation):
+                return True
+        reservation.memory_size = requested_memory_size
+        return False
+
+
     def start_delay(self, delay: float) -> None:
         '''create a "start" event after a random delay between [0, delay]
         Args:
@@ -182,6 +459,8 @@ class AdaptiveContinuousProtocol(Protocol):
             process = Process(self, 'start', [])
             event = Event(self.owner.timeline.now() + random_delay, process)
             self.owner.timeline.schedule(event)
+        else:
+            self.waiting_for_memory = True    # resumed by wakeup() when AC protocol is assigned some memories
 
 
     def init_probability_table(self):
@@ -201,21 +480,30 @@ class AdaptiveContinuousProtocol(Protocol):
             probability_table[neighbor] = 1 / len(neighbors)
         assert abs(sum(probability_table.values()) - 1) < EPSILON
         self.probability_table = probability_table
+        self.update_sampler()
 
 
-    def select_neighbor(self) -> str:
-        '''return the name of the selected neighbor
-           The selection algorithm is roulette wheel
+    def update_sampler(self) -> None:
+        '''rebuild the roulette wheel from the probability table. Need to be called whenever the probability table changes
         '''
         neighbors = []
         probs = []
         for neighbor, prob in sorted(self.probability_table.items()):
             neighbors.append(neighbor)
             probs.append(prob)
-        probs_accumulate = list(accumulate(probs))
+        self.sampler_neighbors = neighbors
+        self.sampler_accumulate = list(accumulate(probs))
+
+
+    def select_neighbor(self) -> str:
+        '''return the name of the selected neighbor
+           The selection algorithm is roulette wheel, the wheel is prebuilt by update_sampler() or kept by the engine
+        '''
         random_number = self.owner.get_generator().random()
-        index = bisect_left(probs_accumulate, random_number)
-        neighbor = neighbors[index]
+        if self.engine is not None:
+            return self.engine.sample(self.engine_row, random_number)
+        index = bisect_left(self.sampler_accumulate, random_number)
+        neighbor = self.sampler_neighbors[index]
         return neighbor
 
 
@@ -228,7 +516,7 @@ class AdaptiveContinuousProtocol(Protocol):
             scr (str): name of the node that sent the message
             msg (AdaptiveContinuousMessage): message received
         '''
-        log.logger.debug('{} receive message from {}: {}'.format(self.owner.name, src, msg))
+        log.logger.debug('%s receive message from %s: %s', self.owner.name, src, msg)
 
         if msg.msg_type is ACMsgType.REQUEST:
             if self.adaptive_memory_used >= self.adaptive_max_memory:  # AC Protocol cannot exceed adaptive_max_memory
@@ -236,25 +524,33 @@ class AdaptiveContinuousProtocol(Protocol):
                 log.logger.debug(f'{self.owner.name} adaptive_memory_used reached the maximum')
             else:
                 reservation = msg.reservation
-                if self.resource_reservation.schedule(reservation):    # has available quantum memory
-                    log.logger.debug(f'{self.owner.name} adaptive_memory_used is increased from {self.adaptive_memory_used} to {self.adaptive_memory_used + 1}')
-                    self.adaptive_memory_used += 1
+                memory_size = min(reservation.memory_size, self.adaptive_max_memory - self.adaptive_memory_used)
+                if self.schedule_batch(reservation, memory_size):    # has available quantum memory
+                    log.logger.debug(f'{self.owner.name} adaptive_memory_used is increased from {self.adaptive_memory_used} to {self.adaptive_memory_used + reservation.memory_size}')
+                    self.adaptive_memory_used += reservation.memory_size
                     path = [src, self.owner.name]  # path only has two nodes
                     rules = self.resource_reservation.create_rules_adaptive(path, reservation)
                     self.resource_reservation.load_rules_adaptive(rules, reservation)
                     reservation.set_path(path)
-                    new_msg = AdaptiveContinuousMessage(ACMsgType.RESPOND, msg.reservation, answer=True, path=path)
+                    new_msg = AdaptiveContinuousMessage(ACMsgType.RESPOND, msg.reservation, answer=True, path=path, memory_size=reservation.memory_size)
                 else:                                                  # no available quantum memory
                     new_msg = AdaptiveContinuousMessage(ACMsgType.RESPOND, msg.reservation, answer=False)
             self.owner.send_message(src, new_msg)
 
         elif msg.msg_type is ACMsgType.RESPOND:
+            # the memories this node reserved for the reservation, the neighbor tells how many of them it accepted
+            reserved_cards = [card for card in self.resource_reservation.timecards if msg.reservation in card.reservations]
             if msg.answer is False:           # neighbor doesn't has available memory
-                for card in self.resource_reservation.timecards:
+                for card in reserved_cards:
                     card.remove(msg.reservation) # clear up the timecards
-                log.logger.debug(f'{self.owner.name} not going to establish entanglement link {self.owner.name}-{src}; adaptive_memory_used is decreased from {self.adaptive_memory_used} to {self.adaptive_memory_used - 1}')
-                self.adaptive_memory_used -= 1
+                log.logger.debug(f'{self.owner.name} not going to establish entanglement link {self.owner.name}-{src}; adaptive_memory_used is decreased from {self.adaptive_memory_used} to {self.adaptive_memory_used - len(reserved_cards)}')
+                self.adaptive_memory_used -= len(reserved_cards)
             else:                             # neighbor has available memory
+                accepted = msg.memory_size
+                for card in reserved_cards[accepted:]:  # the neighbor accepted fewer memories than requested
+                    card.remove(msg.reservation)
+                self.adaptive_memory_used -= len(reserved_cards) - accepted
+                msg.reservation.memory_size = accepted
                 rules = self.resource_reservation.create_rules_adaptive(msg.path, msg.reservation)
                 self.resource_reservation.load_rules_adaptive(rules, msg.reservation)
                 log.logger.info(f'{self.owner.name} attempting to establish entanglement link {self.owner.name}-{src}')
@@ -263,7 +559,9 @@ class AdaptiveContinuousProtocol(Protocol):
         elif msg.msg_type is ACMsgType.CACHE:
             timestamp = msg.timestamp
             path = msg.reservation.path
-            self.cache.append((timestamp, path))
+            neighbors = self.cache.add(timestamp, path)
+            if self.engine is not None:
+                self.engine.add_path(self.engine_row, timestamp, neighbors)
             log.logger.debug(f'{self.owner.name} added {(timestamp, path)} to cache')
         
         elif msg.msg_type is ACMsgType.EXPIRE:
@@ -294,28 +592,39 @@ class AdaptiveContinuousProtocol(Protocol):
                 log.logger.info(f'Rule expired: {rule}')
 
 
-    def adaptive_memory_used_minus_one(self, memory: Memory) -> None:
+    def adaptive_memory_used_minus_one(self, memory: Memory, reservation: ReservationAdaptive = None) -> None:
         '''reduce the self.adaptive_memory_used by 1. Called right after the entanglement generation protocol is expired
         Args:
             memory: this is the memory that is set to RAW (due to expired rule), released from the adaptive continuous protocol
+            reservation: the reservation that the memory was reserved for
         '''
         assert self.adaptive_memory_used > 0, f"{self.owner.name} adaptive_memory_used={self.adaptive_memory_used}"
         self.adaptive_memory_used -= 1
         log.logger.debug(f'{self.owner.name} adaptive_memory_used is reduced from {self.adaptive_memory_used + 1} to {self.adaptive_memory_used}')
         # remove the entanglement pair that memory is in
-        ep_to_delete = None
-        for entanglement_pair in self.generated_entanglement_pairs:
-            if entanglement_pair[0][1] == memory.name:
-                ep_to_delete = entanglement_pair
-                break
-            elif entanglement_pair[1][1] == memory.name:
-                ep_to_delete = entanglement_pair
-                break
+        ep_to_delete = self.generated_entanglement_pairs.get_by_memory(memory.name)
         if ep_to_delete is None:  # the entanglement pair that includes argument memory doesn't exist, because the EP generation is not successfull yet
             log.logger.info(f'{self.owner.name} {memory.name} is not found in self.generated_entanglement_pairs!')
         else:
             self.generated_entanglement_pairs.remove(ep_to_delete)
             log.logger.info(f'{self.owner.name} removed EP {ep_to_delete}')
+        self.wakeup()
+
+
+    def wakeup(self) -> None:
+        '''resume the cycle paused by start() after a memory used by the adaptive continuous protocol is released
+        '''
+        if self.waiting_for_memory and self.adaptive_memory_used < self.adaptive_max_memory:
+            self.waiting_for_memory = False
+            self.start_delay(delay = self.delay_no_memory)
+
+
+    def get_probability_table(self) -> dict:
+        '''return the current probability table, neighbor name -> probability
+        '''
+        if self.engine is not None:
+            return self.engine.get_probability_table(self.engine_row)
+        return self.probability_table
 
 
     def update_probability_table(self, elapse: int):
@@ -329,28 +638,11 @@ class AdaptiveContinuousProtocol(Protocol):
         if self.update_prob == False:
             return
         # print(self.probability_table)
-        # 1. get all the entanglement paths
+        # 1. evict the entanglement paths that are out of the window
         current_time = self.owner.timeline.now()
-        paths = []
-        for i in range(len(self.cache) - 1, -1, -1):
-            timestamp = self.cache[i][0]
-            if current_time - elapse <= timestamp:
-                paths.append(self.cache[i][1])
-        # print(f'{self.owner.name} {paths}')
+        self.cache.evict(current_time - elapse)
         # 2. get the all the neighbors that is in the entanglement path
-        neighbor_in_path = set()
-        this_node = self.owner.name
-        for path in paths:
-            this_index = None
-            for i in range(len(path)):
-                if path[i] == this_node:
-                    this_index = i
-                    break
-            if this_index is not None:
-                if this_index >= 1:
-                    neighbor_in_path.add(path[this_index - 1])
-                if this_index <= len(path) - 2:
-                    neighbor_in_path.add(path[this_index + 1])
+        neighbor_in_path = self.cache.get_neighbors()
         # 3.1 if neighbor is in the set neighbor_in_path, then increase probability
         # delta = 1 / len(self.probability_table.keys())
         delta = 0.05
@@ -365,15 +657,10 @@ class AdaptiveContinuousProtocol(Protocol):
         summ = sum(self.probability_table.values())
         for neighbor in self.probability_table.keys():
             self.probability_table[neighbor] /= summ
+        self.update_sampler()
 
         if self.print_prob_table:
-            print(f'{self.owner.name}, {self.probability_table_update_count}, ', end = '')
-            for node, prob in self.probability_table.items():
-                if node != '':
-                    print(f'{node}: {prob:.4}', end = ' ')
-                else:
-                    print(f'None: {prob:.4}', end = ' ')
-            print()
+            print_probability_table(self.owner.name, self.probability_table_update_count, self.probability_table)
 
         self.probability_table_update_count += 1
 
@@ -383,8 +670,7 @@ class AdaptiveContinuousProtocol(Protocol):
         Args:
             entanglement_link: Tuple[(node_name, memory_name), (remote_node_name, remote_memory_name)]
         '''
-        if entanglement_pair not in self.generated_entanglement_pairs:
-            self.generated_entanglement_pairs.add(entanglement_pair)
+        if self.generated_entanglement_pairs.add(entanglement_pair, self.owner.timeline.now()):
             log.logger.info(f'{self.owner.name} added EP {entanglement_pair}')
         else:
             log.logger.warning(f'{self.owner.name} EP {entanglement_pair} already exist')
@@ -397,26 +683,16 @@ class AdaptiveContinuousProtocol(Protocol):
             Tuple[(node_name, memory_name), (remote_node_name, remote_memory_name)] -- the freshest entanglement pair
             None -- if no match exist
         '''
-        entanglement_pairs = []
-        for entanglement_pair in sorted(self.generated_entanglement_pairs):
-            ent_this_node_name   = entanglement_pair[0][0]
-            ent_remote_node_name = entanglement_pair[1][0]
-            if ent_this_node_name == this_node_name and ent_remote_node_name == remote_node_name:
-                entanglement_pairs.append(entanglement_pair)
-        
+        entanglement_pairs = self.generated_entanglement_pairs.get_link(this_node_name, remote_node_name)  # sorted
         if len(entanglement_pairs) == 0:
             return None
 
         if self.strategy == "random":
             return entanglement_pairs[0]
         elif self.strategy == "freshest":
-            freshest_ep = None
-            best_fidelity = 0
-            for ep in entanglement_pairs:
-                fidelity = self.get_fidelity(ep)
-                if fidelity > best_fidelity:
-                    freshest_ep = ep
-                    best_fidelity = fidelity
+            freshest_ep = self.generated_entanglement_pairs.freshest(this_node_name, remote_node_name)
+            if freshest_ep is not None:
+                self.get_fidelity(freshest_ep)  # only the selected entanglement pair is brought up to date
             return freshest_ep
         else:
             raise Exception(f'{self.strategy} not supported')
@@ -437,6 +713,7 @@ class AdaptiveContinuousProtocol(Protocol):
         remote_memory.bds_decohere()
         return local_memory.get_bds_fidelity()
 
+
     def remove_entanglement_pair(self, entanglement_pair: tuple):
         '''remove an entanglement_pair because it is used
         
@@ -500,29 +777,7 @@ class AdaptiveContinuousProtocol(Protocol):
         Return:
             entanglement_pair or None
         '''
-        this_fidelity = 0
-        eps = []
-        this_node  = entanglement_pair[0][0]
-        other_node = entanglement_pair[1][0]
-        for ep in self.generated_entanglement_pairs:
-            if ep == entanglement_pair:
-                this_fidelity = self.get_fidelity(ep)
-            else:
-                if ep[0][0] == this_node and ep[1][0] == other_node:
-                    eps.append(ep)
-
-        if eps:
-            closest_ep = None
-            fidelity_difference = 1
-            for ep in eps:
-                fidelity = self.get_fidelity(ep)
-                difference = abs(this_fidelity - fidelity)
-                if difference < fidelity_difference:
-                    closest_ep = ep
-                    fidelity_difference = difference
-            return closest_ep
-        else:
-            return None
+        return self.generated_entanglement_pairs.closest(entanglement_pair, self.get_fidelity)
 
 
     def create_purification_protocol(self, entanglement_pair: tuple, entanglement_pair2: tuple, rule: "Rule") -> BBPSSW_bds:
@@ -3,9 +3,12 @@
 
 from enum import Enum, auto
 from dataclasses import dataclass
-from collections import defaultdict
-from typing import TYPE_CHECKING, List, DefaultDict, Optional
+from collections import defaultdict, Counter
+from heapq import heapify, heappush, heappop
+from typing import TYPE_CHECKING, List, DefaultDict, Optional, Tuple
 from networkx.classes.graph import Graph
+from networkx import single_source_dijkstra
+import numpy as np
 from itertools import accumulate
 from bisect import bisect_left
 
@@ -20,6 +23,8 @@ from sequence.constants import SECOND
 from sequence.resource_management.memory_manager import MemoryManager
 from reservation import ResourceReservationProtocolAdaptive, ReservationAdaptive
 from purification import BBPSSW_bds
+from entanglement_pair import EntanglementPairInventory
+from ticker import Ticker
 
 
 if TYPE_CHECKING:
@@ -33,6 +38,8 @@ class ACMsgType(Enum):
     '''Defines possible message types between the adaptive controller and the workers, and between the workers
     '''
     UPDATE_PROB_TABLE = auto()  # controller -> worker, update the probability table
+    REQUEST_PROB_TABLE = auto() # worker -> controller, ask for the full probability table after missing an update
+    UPDATE_MEMORY_QUOTA = auto()  # controller -> worker, update the memory quota of the worker and its links
     REQUEST = auto()    # ask if the neighbor has available memory
     RESPOND = auto()    # responding NO/YES
     EXPIRE  = auto()    # expire the rules generated by the requests when the requests are served before the end_time (not related to AC protocol)
@@ -44,32 +51,45 @@ class AdaptiveContinuousMessage(Message):
     '''
     def __init__(self, msg_type: ACMsgType, **kwargs):
         super().__init__(msg_type, receiver='adaptive_continuous')
-        self.string = f'type={msg_type.name}'
         
         if self.msg_type == ACMsgType.UPDATE_PROB_TABLE:
-            self.probability_table = kwargs['probability_table']
-            self.string += f', probability_table={self.probability_table}'
+            self.probability_table = kwargs['probability_table']  # only the changed entries, None value means removing the entry
+            self.version = kwargs.get('version', 0)
+            self.full = kwargs.get('full', False)  # if True, probability_table is the whole table instead of the changed entries
+        elif self.msg_type == ACMsgType.UPDATE_MEMORY_QUOTA:
+            self.adaptive_max_memory = kwargs['adaptive_max_memory']
+            self.link_quota = kwargs['link_quota']
         elif self.msg_type == ACMsgType.REQUEST:
             self.reservation = kwargs['reservation']
-            self.string += f', reservation={self.reservation}'
         elif self.msg_type == ACMsgType.RESPOND:
             self.reservation = kwargs['reservation']
-            self.string += f', reservation={self.reservation}'
             self.answer = kwargs['answer']
-            self.string += f', answer={self.answer}'
             if self.answer == True:
                 self.path = kwargs['path']
-                self.string += f', path={self.path}'
+                self.memory_size = kwargs['memory_size']  # the number of memories the responder accepted
         elif self.msg_type == ACMsgType.INFORM_EP:
             self.selected_ep = kwargs['selected_ep']
             self.rule = kwargs['rule']
-            self.string += f', selected_ep={self.selected_ep}'
         elif self.msg_type == ACMsgType.EXPIRE:
             self.reservation = kwargs['reservation']
-            self.string += f', reservation={self.reservation}'
 
     def __str__(self):
-        return f'|{self.string}|'
+        '''the string is built only when needed (e.g., logging), not for every message
+        '''
+        string = f'type={self.msg_type.name}'
+        if self.msg_type == ACMsgType.UPDATE_PROB_TABLE:
+            string += f', probability_table={self.probability_table}, version={self.version}, full={self.full}'
+        elif self.msg_type == ACMsgType.UPDATE_MEMORY_QUOTA:
+            string += f', adaptive_max_memory={self.adaptive_max_memory}, link_quota={self.link_quota}'
+        elif self.msg_type == ACMsgType.RESPOND:
+            string += f', reservation={self.reservation}, answer={self.answer}'
+            if self.answer == True:
+                string += f', path={self.path}, memory_size={self.memory_size}'
+        elif self.msg_type == ACMsgType.INFORM_EP:
+            string += f', selected_ep={self.selected_ep}'
+        elif self.msg_type in [ACMsgType.REQUEST, ACMsgType.EXPIRE]:
+            string += f', reservation={self.reservation}'
+        return f'|{string}|'
 
 
 @dataclass
@@ -96,16 +116,31 @@ class AdaptiveContinuousController(Protocol):
         self.graph: Graph = None   # the network graph/topology
         self.traffic: list = None  # a list of tuples of (matrix, start_time, end_time)
         self.probability_tables: List[ProbabilityTable] = []
-
-    def init(self, graph: Graph, traffic: defaultdict[str, dict]):
+        self.ticker: Ticker = None  # if not None, the messages due at the same time are sent in one event
+        self.method: str = 'uniform' # how to compute the probability tables, 'uniform' or 'traffic'
+        self.shortest_paths: dict = {}  # src name -> {dst name -> path}, the single source shortest paths of the graph
+        self.adjacency: dict = None     # node name -> list of neighbor names, cached from the graph
+        self.versions: dict = {}        # node name -> version of the last probability table sent to the node
+        self.table_schedules: dict = defaultdict(list)  # node name -> a list of (time, version, table), the tables sent to the node, sorted by time
+        self.online_tables: dict = {}   # node name -> the last probability table sent by update_prob_tables_online()
+        self.online_period: int = 0     # the period (ps) of updating the probability tables from the estimated traffic
+        self.memory_sizes: dict = {}    # node name -> number of memories at the node
+        self.memory_budget: int = 0     # the total number of memories for the AC protocol in the network, 0 means no quota is computed
+        self.memory_cap_ratio: float = 0.5  # a node gives at most this ratio of its memories to the AC protocol
+        self.memory_quotas: dict = {}   # node name -> (adaptive_max_memory, link_quota) last sent to the node
+
+    def init(self, graph: Graph, traffic: defaultdict[str, dict], memory_sizes: dict = None):
         """Initialize the graph and traffic matrix
 
         Args:
             graph: the network graph, i.e., topology
             traffic:  # a list of tuples of (matrix, start_time, end_time) 
+            memory_sizes: node name -> number of memories at the node
         """
         self.set_graph(graph)
         self.set_traffic(traffic)
+        if memory_sizes is not None:
+            self.memory_sizes = memory_sizes
 
     def set_graph(self, graph: Graph):
         """set the graph, i.e., topology
@@ -114,6 +149,19 @@ class AdaptiveContinuousController(Protocol):
             graph: the graph that saves the topology data
         """
         self.graph = graph
+        self.shortest_paths = {}
+        self.adjacency = None
+
+    def get_adjacency(self) -> dict:
+        """return the adjacency list of the graph, computed once per graph
+        """
+        if self.adjacency is None:
+            self.adjacency = defaultdict(list)
+            for u, v in self.graph.edges:
+                self.adjacency[u].append(v)
+                self.adjacency[v].append(u)
+            self.adjacency = dict(self.adjacency)
+        return self.adjacency
 
     def set_traffic(self, traffic: list):
         """Set the traffic
@@ -128,30 +176,165 @@ class AdaptiveContinuousController(Protocol):
         """
         if self.graph is not None and self.traffic is not None:
             for matrix, start_time, end_time in self.traffic:
-                probability_table = self.compute_probability_table_uniform(matrix, start_time, end_time)
+                if self.method == 'traffic':
+                    probability_table = self.compute_probability_table_traffic(matrix, start_time, end_time)
+                else:
+                    probability_table = self.compute_probability_table_uniform(matrix, start_time, end_time)
                 self.probability_tables.append(probability_table)
 
 
     def send_probability_table(self):
-        """schedule events to send messages to the nodes to update the probability table
+        """schedule events to send messages to the nodes to update the probability table.
+        A table is set at the start_time of its traffic matrix and reset at the end_time.
+        Each message only carries the entries that changed against the previous table of the node,
+        and no message is sent to a node whose table doesn't change
         """
+        reset_table = {'': 1}  # the table of a worker after init()
+        tables_at = self.get_tables_at()
+        current_tables = defaultdict(lambda: reset_table)
+        for time in sorted(tables_at):
+            for node, table in tables_at[time].items():
+                self.send_probability_table_update(node, current_tables[node], table, time)
+                current_tables[node] = table
+
+
+    def get_tables_at(self) -> DefaultDict[int, dict]:
+        """return the table of each node at each time (ps), time -> {node name -> table}.
+        A table is set at the start_time of its traffic matrix and reset at the end_time,
+        a table that starts at a time overrides a reset at the same time
+        """
+        reset_table = {'': 1}  # the table of a worker after init()
+        tables_at = defaultdict(dict)
         for probability_table in self.probability_tables:
-            start_time = probability_table.start_time * SECOND
             end_time = probability_table.end_time * SECOND
-            probability_table_dict = probability_table.probability_table_dict
-            for node, probability_table in probability_table_dict.items():
-                msg = AdaptiveContinuousMessage(ACMsgType.UPDATE_PROB_TABLE, probability_table=probability_table)
-                process = Process(self.owner, 'send_message', [node, msg])
-                event = Event(start_time, process)
-                self.owner.timeline.schedule(event)
-                # reset at end_time
-                msg = AdaptiveContinuousMessage(ACMsgType.UPDATE_PROB_TABLE, probability_table=None)
-                process = Process(self.owner, 'send_message', [node, msg])
-                event = Event(end_time, process)
-                self.owner.timeline.schedule(event)
+            for node in probability_table.probability_table_dict:
+                tables_at[end_time][node] = reset_table
+        for probability_table in self.probability_tables:
+            start_time = probability_table.start_time * SECOND
+            for node, table in probability_table.probability_table_dict.items():
+                tables_at[start_time][node] = table
+        return tables_at
+
+
+    def update_graph(self, graph: Graph):
+        """The graph changed in the middle of the simulation, e.g., a quantum link is removed or added.
+        Recompute the probability tables for the new graph, send each node the full table it should have now,
+        and reschedule the updates of the future tables.
+        The full tables have new versions, so the workers ignore the pending updates computed for the old graph
+
+        Args:
+            graph: the new graph
+        """
+        if self.graph is None:  # not initialized yet, init() reads the graph
+            return
+        self.set_graph(graph)
+        now = self.owner.timeline.now()
+        reset_table = {'': 1}  # the table of a worker after init()
+        # 1. the table of each node now, and the tables of the future
+        if self.online_period > 0:
+            flows = self.owner.network_controller.traffic_estimator.get_flows(now)
+            self.online_tables = {}
+            if flows:
+                probability_table = self.compute_probability_table_flows(flows, now / SECOND, (now + self.online_period) / SECOND)
+                self.online_tables = dict(probability_table.probability_table_dict)
+            current_tables = defaultdict(lambda: reset_table, self.online_tables)
+            tables_at = {}
+        else:
+            self.probability_tables = []
+            self.init_prob_tables()
+            tables_at = self.get_tables_at()
+            current_tables = defaultdict(lambda: reset_table)
+            for time in sorted(tables_at):
+                if time <= now:
+                    current_tables.update(tables_at[time])
+        # 2. forget the updates that are not sent yet, send the full tables now
+        nodes = sorted(set(self.graph.nodes) | set(self.table_schedules))
+        for node in nodes:
+            self.table_schedules[node] = [entry for entry in self.table_schedules[node] if entry[0] <= now]
+            self.versions[node] = self.versions.get(node, 0) + 1
+            self.table_schedules[node].append((now, self.versions[node], current_tables[node]))
+            self.send_full_probability_table(node)
+        # 3. reschedule the updates of the future tables
+        for time in sorted(tables_at):
+            if time > now:
+                for node, table in tables_at[time].items():
+                    self.send_probability_table_update(node, current_tables[node], table, time)
+                    current_tables[node] = table
+
+
+    def send_probability_table_update(self, node: str, old_table: dict, new_table: dict, time: int):
+        """schedule a message at time that updates the table of node from old_table to new_table, if they are different
+
+        Args:
+            node: the node name
+            old_table: the probability table of the node before the update
+            new_table: the probability table of the node after the update
+            time: the time (ps) to send the message
+        """
+        delta = self.diff_probability_table(old_table, new_table)
+        if not delta:
+            return
+        self.versions[node] = self.versions.get(node, 0) + 1
+        self.table_schedules[node].append((time, self.versions[node], new_table))
+        msg = AdaptiveContinuousMessage(ACMsgType.UPDATE_PROB_TABLE, probability_table=delta, version=self.versions[node])
+        process = Process(self.owner, 'send_message', [node, msg])
+        self.schedule_process(process, time)
+
+
+    def get_scheduled_table(self, node: str, time: int) -> Tuple[int, dict]:
+        """return the version and the probability table that the node should have at time, i.e., the last table sent before time
+
+        Args:
+            node: the node name
+            time: the time (ps)
+        """
+        for sent_time, version, table in reversed(self.table_schedules[node]):
+            if sent_time <= time:
+                return version, table
+        return 0, {'': 1}  # the table of a worker after init()
+
+
+    def send_full_probability_table(self, node: str):
+        """send the whole probability table that the node should have now, e.g., the node missed an update
+
+        Args:
+            node: the node name
+        """
+        version, table = self.get_scheduled_table(node, self.owner.timeline.now())
+        msg = AdaptiveContinuousMessage(ACMsgType.UPDATE_PROB_TABLE, probability_table=dict(table), version=version, full=True)
+        self.owner.send_message(node, msg)
+
+
+    @staticmethod
+    def diff_probability_table(old_table: dict, new_table: dict) -> dict:
+        """return the entries of new_table that are different from old_table, the entries only in old_table have None value
+
+        Args:
+            old_table: the probability table before the update
+            new_table: the probability table after the update
+        """
+        delta = {neighbor: prob for neighbor, prob in new_table.items() if old_table.get(neighbor) != prob}
+        for neighbor in old_table:
+            if neighbor not in new_table:
+                delta[neighbor] = None
+        return delta
+
 
+    def schedule_process(self, process: Process, time: int):
+        """schedule a process at time, on the ticker if there is one
 
-    def compute_probability_table_uniform(self, matrix: List[List], start_time: float, end_time: float) -> ProbabilityTable:
+        Args:
+            process: the process
+            time: the time (ps) to run the process
+        """
+        if self.ticker is not None:
+            self.ticker.register(process, time)
+        else:
+            event = Event(time, process)
+            self.owner.timeline.schedule(event)
+
+
+    def compute_probability_table_uniform(self, matrix: dict, start_time: float, end_time: float) -> ProbabilityTable:
         """Create a uniform probability table for each node
 
         Args:
@@ -160,12 +343,8 @@ class AdaptiveContinuousController(Protocol):
             end_time: the end time of the matrix (s)        
         """
         probability_table = defaultdict(dict)
-        # 1. create the graph
-        g = defaultdict(list)
-        for edge in self.graph.edges:
-            u, v = edge
-            g[u].append(v)
-            g[v].append(u)
+        # 1. get the graph
+        g = self.get_adjacency()
         # 2. create the probability table
         for node in g:
             neighbors = g[node]
@@ -180,9 +359,237 @@ class AdaptiveContinuousController(Protocol):
         return probability_table
 
 
+    def compute_probability_table_traffic(self, matrix: dict, start_time: float, end_time: float) -> ProbabilityTable:
+        """Create the probability table of each node from the traffic matrix, see compute_probability_table_flows()
+
+        Args:
+            matrix: the (sparse) traffic matrix, matrix[i, j] is the probability of a request from router_i to router_j
+            start_time: the start time of the matrix (s)
+            end_time: the end time of the matrix (s)
+        """
+        flows = self.matrix_to_flows(matrix)
+        return self.compute_probability_table_flows(flows, start_time, end_time)
+
+
+    @staticmethod
+    def matrix_to_flows(matrix: dict) -> dict:
+        """return the flows of the traffic matrix, (src name, dst name) -> probability, sorted by (i, j)
+
+        Args:
+            matrix: the (sparse) traffic matrix, matrix[i, j] is the probability of a request from router_i to router_j
+        """
+        flows = {}
+        for (i, j), prob in sorted(matrix.items()):
+            if prob > 0:
+                flows[(f'router_{i}', f'router_{j}')] = prob
+        return flows
+
+
+    def compute_probability_table_flows(self, flows: dict, start_time: float, end_time: float) -> ProbabilityTable:
+        """Create the probability table of each node from the traffic flows.
+        Each flow (src, dst) is routed over the static shortest path,
+        then the probability of a neighbor is the traffic that goes over the link between the node and the neighbor,
+        and the probability of no neighbor ('') is the traffic that doesn't go through the node.
+        The per-link traffic is the product of the (sparse) flow-link incidence matrix and the flow probabilities.
+
+        Args:
+            flows: (src name, dst name) -> probability
+            start_time: the start time of the table (s)
+            end_time: the end time of the table (s)
+        """
+        links, link_traffic, nodes, node_traffic, total = self.compute_traffic(flows)
+        # 1. create the probability table
+        probability_table = defaultdict(dict)
+        for (node, neighbor), traffic in zip(links, link_traffic):
+            probability_table[node][neighbor] = float(traffic)
+        for node, traffic in zip(nodes, node_traffic):
+            node_probility_table = probability_table[node]
+            node_probility_table[''] = max(float(total - traffic), 0)
+            summ = sum(node_probility_table.values())
+            if summ == 0:  # no traffic at all, then uniform
+                for neighbor in node_probility_table:
+                    node_probility_table[neighbor] = 1 / len(node_probility_table)
+            else:
+                for neighbor in node_probility_table:
+                    node_probility_table[neighbor] /= summ
+        # 2. return the desired object
+        probability_table = ProbabilityTable(start_time, end_time, probability_table)
+        return probability_table
+
+
+    def compute_traffic(self, flows: dict) -> Tuple[list, np.ndarray, list, np.ndarray, float]:
+        """Route each flow over the static shortest path, and compute the traffic on each directed link and each node.
+        The traffic is the product of the (sparse) flow-link (flow-node) incidence matrix and the flow probabilities.
+
+        Args:
+            flows: (src name, dst name) -> probability
+        Return:
+            the directed links, the traffic on each link, the nodes, the traffic through each node, the total traffic
+        """
+        # 1. index the directed links and the nodes
+        nodes = sorted(self.graph.nodes)
+        node_index = {node: i for i, node in enumerate(nodes)}
+        adjacency = self.get_adjacency()
+        links = []
+        link_index = {}
+        for node in nodes:
+            for neighbor in sorted(adjacency.get(node, [])):
+                link_index[(node, neighbor)] = len(links)
+                links.append((node, neighbor))
+        # 2. the non-zero entries of the incidence matrices, flow -> the directed links and the nodes in its path
+        flow_probs = []
+        link_flows, link_columns = [], []
+        node_flows, node_columns = [], []
+        for (src, dst), prob in flows.items():
+            if prob > 0:
+                path = self.get_shortest_path(src, dst)
+                if path is None:
+                    continue
+                flow = len(flow_probs)
+                flow_probs.append(prob)
+                for k in range(len(path) - 1):
+                    link_flows += [flow, flow]
+                    link_columns += [link_index[(path[k], path[k + 1])], link_index[(path[k + 1], path[k])]]
+                node_flows += [flow] * len(path)
+                node_columns += [node_index[node] for node in path]
+        # 3. incidence^T x flow probabilities
+        flow_probs = np.array(flow_probs, dtype=float)
+        total = flow_probs.sum()
+        link_traffic = np.bincount(np.array(link_columns, dtype=int), weights=flow_probs[link_flows], minlength=len(links))
+        node_traffic = np.bincount(np.array(node_columns, dtype=int), weights=flow_probs[node_flows], minlength=len(nodes))
+        return links, link_traffic, nodes, node_traffic, float(total)
+
+
+    def compute_memory_quota(self, flows: dict) -> Tuple[dict, dict]:
+        """Allocate the memory budget of the AC protocol to the links, greedily by the marginal gain.
+        The k-th memory pair on a link gains traffic / k, a memory pair on a link uses one memory at both ends,
+        and a node gives at most memory_cap_ratio of its memories.
+
+        Args:
+            flows: (src name, dst name) -> probability
+        Return:
+            node name -> adaptive_max_memory, and node name -> {neighbor name -> the number of memories on the link}
+        """
+        links, link_traffic, nodes, _, _ = self.compute_traffic(flows)
+        capacity = {node: int(self.memory_sizes.get(node, 0) * self.memory_cap_ratio) for node in nodes}
+        traffic = defaultdict(float)  # undirected link -> traffic
+        for (node, neighbor), t in zip(links, link_traffic):
+            if node < neighbor:
+                traffic[(node, neighbor)] += float(t)
+            else:
+                traffic[(neighbor, node)] += float(t)
+        quota = Counter()  # undirected link -> number of memory pairs
+        heap = [(-t, link) for link, t in sorted(traffic.items()) if t > 0]
+        heapify(heap)
+        budget = self.memory_budget
+        while heap and budget >= 2:
+            _, (node, neighbor) = heappop(heap)
+            if capacity[node] == 0 or capacity[neighbor] == 0:
+                continue   # the link is full
+            quota[(node, neighbor)] += 1
+            capacity[node] -= 1
+            capacity[neighbor] -= 1
+            budget -= 2
+            gain = traffic[(node, neighbor)] / (quota[(node, neighbor)] + 1)
+            heappush(heap, (-gain, (node, neighbor)))
+        node_quota = {node: 0 for node in nodes}
+        link_quota = {node: {} for node in nodes}
+        for (node, neighbor), number in sorted(quota.items()):
+            node_quota[node] += number
+            node_quota[neighbor] += number
+            link_quota[node][neighbor] = number
+            link_quota[neighbor][node] = number
+        return node_quota, link_quota
+
+
+    def send_memory_quota(self, flows: dict, time: int):
+        """compute the memory quotas from the flows, and schedule messages at time to the nodes whose quota changes
+
+        Args:
+            flows: (src name, dst name) -> probability
+            time: the time (ps) to send the messages
+        """
+        node_quota, link_quota = self.compute_memory_quota(flows)
+        for node in node_quota:
+            quota = (node_quota[node], link_quota[node])
+            if self.memory_quotas.get(node) == quota:
+                continue
+            self.memory_quotas[node] = quota
+            msg = AdaptiveContinuousMessage(ACMsgType.UPDATE_MEMORY_QUOTA, adaptive_max_memory=quota[0], link_quota=quota[1])
+            process = Process(self.owner, 'send_message', [node, msg])
+            self.schedule_process(process, time)
+
+
+    def send_memory_quota_schedule(self):
+        """send the memory quotas computed from each traffic matrix at the start time of the matrix
+        """
+        if self.memory_budget > 0 and self.graph is not None and self.traffic is not None:
+            for matrix, start_time, end_time in sorted(self.traffic, key=lambda traffic: traffic[1]):
+                self.send_memory_quota(self.matrix_to_flows(matrix), start_time * SECOND)
+
+
+    def start_online(self, period: int):
+        """start updating the probability tables from the estimated traffic every period,
+        instead of the a priori traffic matrices
+
+        Args:
+            period: the period (ps)
+        """
+        self.online_period = period
+        process = Process(self, 'update_prob_tables_online', [])
+        if self.ticker is not None:
+            self.ticker.register(process, self.owner.timeline.now() + period, period)
+        else:
+            event = Event(self.owner.timeline.now() + period, process)
+            self.owner.timeline.schedule(event)
+
+
+    def update_prob_tables_online(self):
+        """recompute the probability tables from the traffic estimated by the network controller,
+        and send the changed entries to the workers
+        """
+        now = self.owner.timeline.now()
+        flows = self.owner.network_controller.traffic_estimator.get_flows(now)
+        if flows:
+            probability_table = self.compute_probability_table_flows(flows, now / SECOND, (now + self.online_period) / SECOND)
+            reset_table = {'': 1}  # the table of a worker after init()
+            for node, table in probability_table.probability_table_dict.items():
+                self.send_probability_table_update(node, self.online_tables.get(node, reset_table), table, now)
+                self.online_tables[node] = table
+            if self.memory_budget > 0:
+                self.send_memory_quota(flows, now)
+        if self.ticker is None:
+            process = Process(self, 'update_prob_tables_online', [])
+            event = Event(now + self.online_period, process)
+            self.owner.timeline.schedule(event)
+
+
+    def get_shortest_path(self, src: str, dst: str) -> Optional[list]:
+        """return the static shortest path from src to dst, None if no path.
+        Break ties the same way as the forwarding tables, i.e., the path is computed from the node with the smaller name
+
+        Args:
+            src: the source node name
+            dst: the destination node name
+        """
+        if src not in self.graph or dst not in self.graph:
+            return None
+        if dst > src:
+            source, target = src, dst
+        else:
+            source, target = dst, src
+        if source not in self.shortest_paths:
+            _, self.shortest_paths[source] = single_source_dijkstra(self.graph, source)
+        path = self.shortest_paths[source].get(target)
+        if path is None:
+            return None
+        return path if source == src else path[::-1]
+
+
     def received_message(self, src, msg):
         """Receive classical message from another node."""
-        pass
+        if msg.msg_type is ACMsgType.REQUEST_PROB_TABLE:
+            self.send_full_probability_table(src)
 
 
 
@@ -196,24 +603,56 @@ class AdaptiveContinuousWorker(Protocol):
         self.adaptive_memory_used = 0
         self.resource_reservation = resource_reservation
         self.probability_table = {}
-        self.generated_entanglement_pairs = set()
+        self.probability_table_version = 0  # the version of the probability table sent by the controller
+        self.waiting_for_full_table = False # missed an update, the deltas are ignored until the full table arrives
+        self.sampler_neighbors = []   # the neighbors of the roulette wheel, sorted
+        self.sampler_accumulate = []  # the accumulated probabilities of the roulette wheel
+        self.generated_entanglement_pairs = EntanglementPairInventory()
         self.strategy = 'freshest'
         self.period = period
         self.delay_no_memory = 0             # this node either reached adaptive_max_memory or no memory 
         self.delay_select_neighbor_none = 0  # this node selected none as neighbor
         self.delay_remote_response = 0       # neighbor has a response
+        self.waiting_for_memory = False      # the cycle is paused because adaptive_memory_used reached adaptive_max_memory
+        self.batch_size = 1                  # the maximum number of memories reserved with a neighbor in one cycle
+        self.link_quota = {}                 # neighbor name -> the maximum number of memories used with the neighbor, empty means no limit per link
+        self.link_memory_used = defaultdict(int)  # neighbor name -> the number of memories currently used with the neighbor
+        self.ticker: Ticker = None           # if not None, the start events and the ends of the AC reservations due at the same time run in one event
         self.update_period(period)
 
     def received_message(self, src: str, msg: AdaptiveContinuousMessage):
         """Receive classical message from another node.
         """
-        log.logger.debug('{} receive message from {}: {}'.format(self.owner.name, src, msg))
+        log.logger.debug('%s receive message from %s: %s', self.owner.name, src, msg)
 
         if msg.msg_type is ACMsgType.UPDATE_PROB_TABLE:
-            if msg.probability_table is not None:
-                self.probability_table = msg.probability_table
-            else:
+            if msg.probability_table is None:
                 self.init()
+            elif msg.full:
+                self.probability_table = dict(msg.probability_table)
+                self.probability_table_version = msg.version
+                self.waiting_for_full_table = False
+                self.update_sampler()
+            elif msg.version <= self.probability_table_version:
+                log.logger.debug(f'{self.owner.name} probability table version={self.probability_table_version}, ignores the stale update of version={msg.version}')
+            elif msg.version != self.probability_table_version + 1 or self.waiting_for_full_table:
+                # the delta is against a table this node doesn't have, ask the controller for the full table
+                if not self.waiting_for_full_table:
+                    log.logger.warning(f'{self.owner.name} probability table version={self.probability_table_version}, receives the update of version={msg.version}, requests the full table')
+                    self.waiting_for_full_table = True
+                    self.owner.send_message(src, AdaptiveContinuousMessage(ACMsgType.REQUEST_PROB_TABLE))
+            else:
+                for neighbor, prob in msg.probability_table.items():
+                    if prob is None:
+                        self.probability_table.pop(neighbor, None)
+                    else:
+                        self.probability_table[neighbor] = prob
+                self.probability_table_version = msg.version
+                self.update_sampler()
+
+        elif msg.msg_type is ACMsgType.UPDATE_MEMORY_QUOTA:
+            self.link_quota = msg.link_quota
+            self.set_adaptive_max_memory(msg.adaptive_max_memory)
 
         elif msg.msg_type is ACMsgType.REQUEST:
             if self.adaptive_memory_used >= self.adaptive_max_memory:
@@ -221,25 +660,36 @@ class AdaptiveContinuousWorker(Protocol):
                 log.logger.debug(f'{self.owner.name} adaptive_memory_used reached the maximum')
             else:
                 reservation: ReservationAdaptive = msg.reservation
-                if self.resource_reservation.schedule(reservation):
-                    log.logger.debug(f'{self.owner.name} adaptive_memory_used is increased from {self.adaptive_memory_used} to {self.adaptive_memory_used+1}')
-                    self.adaptive_memory_used += 1
+                memory_size = min(reservation.memory_size, self.adaptive_max_memory - self.adaptive_memory_used, self.get_link_memory_left(src))
+                if self.schedule_batch(reservation, memory_size):
+                    log.logger.debug(f'{self.owner.name} adaptive_memory_used is increased from {self.adaptive_memory_used} to {self.adaptive_memory_used + reservation.memory_size}')
+                    self.adaptive_memory_used += reservation.memory_size
+                    self.link_memory_used[src] += reservation.memory_size
                     path = [src, self.owner.name]
                     rules = self.resource_reservation.create_rules_adaptive(path, reservation)
                     self.resource_reservation.load_rules_adaptive(rules, reservation)
                     reservation.set_path(path)
-                    new_msg = AdaptiveContinuousMessage(ACMsgType.RESPOND, reservation=msg.reservation, answer=True, path=path)
+                    new_msg = AdaptiveContinuousMessage(ACMsgType.RESPOND, reservation=msg.reservation, answer=True, path=path, memory_size=reservation.memory_size)
                 else:
                     new_msg = AdaptiveContinuousMessage(ACMsgType.RESPOND, reservation=msg.reservation, answer=False)
             self.owner.send_message(src, new_msg)
         
         elif msg.msg_type is ACMsgType.RESPOND:
+            # the memories this node reserved for the reservation, the neighbor tells how many of them it accepted
+            reserved_cards = [card for card in self.resource_reservation.timecards if msg.reservation in card.reservations]
             if msg.answer is False:              # neighbor doesn't has available memory
-                for card in self.resource_reservation.timecards:
+                for card in reserved_cards:
                     card.remove(msg.reservation) # clear up the timecards
-                log.logger.debug(f'{self.owner.name} not going to establish entanglement link {self.owner.name}-{src}; adaptive_memory_used is decreased from {self.adaptive_memory_used} to {self.adaptive_memory_used - 1}')
-                self.adaptive_memory_used -= 1
+                log.logger.debug(f'{self.owner.name} not going to establish entanglement link {self.owner.name}-{src}; adaptive_memory_used is decreased from {self.adaptive_memory_used} to {self.adaptive_memory_used - len(reserved_cards)}')
+                self.adaptive_memory_used -= len(reserved_cards)
+                self.link_memory_used[src] -= len(reserved_cards)
             else:                                # neighbor has available timecards
+                accepted = msg.memory_size
+                for card in reserved_cards[accepted:]:  # the neighbor accepted fewer memories than requested
+                    card.remove(msg.reservation)
+                self.adaptive_memory_used -= len(reserved_cards) - accepted
+                self.link_memory_used[src] -= len(reserved_cards) - accepted
+                msg.reservation.memory_size = accepted
                 rules = self.resource_reservation.create_rules_adaptive(msg.path, msg.reservation)
                 self.resource_reservation.load_rules_adaptive(rules, msg.reservation)
                 log.logger.info(f'{self.owner.name} attempting to establish entanglement link {self.owner.name}-{src}')
@@ -277,6 +727,7 @@ class AdaptiveContinuousWorker(Protocol):
         """Initialize the AC worker, i.e., do not se
         """
         self.probability_table[''] = 1
+        self.update_sampler()
 
 
     def update_period(self, period: int) -> None:
@@ -291,6 +742,25 @@ class AdaptiveContinuousWorker(Protocol):
         self.delay_remote_response      = 3 * self.delay_no_memory
 
 
+    def set_adaptive_max_memory(self, adaptive_max_memory: int) -> None:
+        '''set the max memory used for the adaptive continuous protocol, and resume the cycle if it was paused for memory.
+           Called by main.py (-ma) on every worker, and when the controller sends a memory quota
+
+        Args:
+            adaptive_max_memory (int): the maximum number of memories used by the adaptive continuous protocol
+        '''
+        self.adaptive_max_memory = adaptive_max_memory
+        self.wakeup()
+
+
+    def get_link_memory_left(self, neighbor: str) -> int:
+        '''return the number of memories that can still be used with the neighbor under the link quota
+        '''
+        if not self.link_quota:
+            return self.adaptive_max_memory - self.adaptive_memory_used
+        return self.link_quota.get(neighbor, 0) - self.link_memory_used[neighbor]
+
+
     def start_delay(self, delay: float) -> None:
         '''create a "start" event after a random delay between [0, delay]
         Args:
@@ -300,15 +770,20 @@ class AdaptiveContinuousWorker(Protocol):
             assert delay >= 0, f'delay = {delay} is negative'
             random_delay = int(self.owner.get_generator().uniform(0, delay))
             process = Process(self, 'start', [])
-            event = Event(self.owner.timeline.now() + random_delay, process)
-            self.owner.timeline.schedule(event)
+            if self.ticker is not None:
+                self.ticker.register(process, self.owner.timeline.now() + random_delay)
+            else:
+                event = Event(self.owner.timeline.now() + random_delay, process)
+                self.owner.timeline.schedule(event)
+        else:
+            self.waiting_for_memory = True    # resumed by wakeup() when AC protocol is assigned some memories
 
     def start(self) -> None:
         '''start a new "cycle" of the adaptive-continuous protocol
         '''
         # check whether the adaptive protocol has used up its memory quota
         if self.adaptive_memory_used >= self.adaptive_max_memory:
-            self.start_delay(delay = self.delay_no_memory)  # schedule a start event in the future
+            self.waiting_for_memory = True  # the cycle is resumed by wakeup() when a memory is released
             return
 
         # select neighbor
@@ -318,36 +793,66 @@ class AdaptiveContinuousWorker(Protocol):
             self.start_delay(delay = self.delay_select_neighbor_none)  # schedule a start event in the future
             return
 
-        log.logger.debug(f'{self.owner.name} selected neighbor {neighbor}, adaptive_memory_used is increased from {self.adaptive_memory_used} to {self.adaptive_memory_used + 1}')
-        self.adaptive_memory_used += 1
+        memory_size = min(self.batch_size, self.adaptive_max_memory - self.adaptive_memory_used, self.get_link_memory_left(neighbor))
+        if memory_size <= 0:
+            log.logger.debug(f'{self.owner.name} selected neighbor {neighbor}, but the link reached its memory quota')
+            self.start_delay(delay = self.delay_select_neighbor_none)
+            return
         round_trip_time = self.owner.cchannels[neighbor].delay * 2
         start_time = self.owner.timeline.now() + round_trip_time    # consider a round trip time for the "handshaking"
         end_time = self.round_to_period(start_time + self.period)   # the 'period' is one second
         # set up reservation
-        reservation = ReservationAdaptive(self.owner.name, neighbor, start_time, end_time, memory_size=1, fidelity=0.9)
-        if self.resource_reservation.schedule(reservation):
+        reservation = ReservationAdaptive(self.owner.name, neighbor, start_time, end_time, memory_size=memory_size, fidelity=0.9)
+        if self.schedule_batch(reservation, memory_size):
             # able to schedule on current node, i.e., has memory
+            log.logger.debug(f'{self.owner.name} selected neighbor {neighbor}, adaptive_memory_used is increased from {self.adaptive_memory_used} to {self.adaptive_memory_used + reservation.memory_size}')
+            self.adaptive_memory_used += reservation.memory_size
+            self.link_memory_used[neighbor] += reservation.memory_size
             msg = AdaptiveContinuousMessage(ACMsgType.REQUEST, reservation=reservation)
             self.owner.send_message(neighbor, msg)
         else:
             # not able to schedule on current node (lack of memory), schedule another start event after 1 ms
-            self.adaptive_memory_used -= 1
             self.start_delay(delay = self.delay_no_memory)
 
 
-    def select_neighbor(self) -> str:
-        '''return the name of the selected neighbor
-           The selection algorithm is roulette wheel
+    def schedule_batch(self, reservation: ReservationAdaptive, memory_size: int) -> bool:
+        '''schedule the reservation on this node with as many memories as possible, at most memory_size
+
+        Args:
+            reservation: the reservation created by the adaptive continuous protocol
+            memory_size: the maximum number of memories
+        Return:
+            bool: True if at least one memory is scheduled, then reservation.memory_size is set to the number of scheduled memories.
+                  False if no memory is scheduled, then reservation.memory_size is not changed
+        '''
+        requested_memory_size = reservation.memory_size
+        for size in range(memory_size, 0, -1):
+            reservation.memory_size = size
+            if self.resource_reservation.schedule(reservation):
+                return True
+        reservation.memory_size = requested_memory_size
+        return False
+
+
+    def update_sampler(self) -> None:
+        '''rebuild the roulette wheel from the probability table. Need to be called whenever the probability table changes
         '''
         neighbors = []
         probs = []
         for neighbor, prob in sorted(self.probability_table.items()):
             neighbors.append(neighbor)
             probs.append(prob)
-        probs_accumulate = list(accumulate(probs))
+        self.sampler_neighbors = neighbors
+        self.sampler_accumulate = list(accumulate(probs))
+
+
+    def select_neighbor(self) -> str:
+        '''return the name of the selected neighbor
+           The selection algorithm is roulette wheel, the wheel is prebuilt by update_sampler()
+        '''
         random_number = self.owner.get_generator().random()
-        index = bisect_left(probs_accumulate, random_number)
-        neighbor = neighbors[index]
+        index = bisect_left(self.sampler_accumulate, random_number)
+        neighbor = self.sampler_neighbors[index]
         return neighbor
 
     def round_to_period(self, time: int) -> int:
@@ -429,8 +934,7 @@ class AdaptiveContinuousWorker(Protocol):
         Args:
             entanglement_link: Tuple[(node_name, memory_name), (remote_node_name, remote_memory_name)]
         '''
-        if entanglement_pair not in self.generated_entanglement_pairs:
-            self.generated_entanglement_pairs.add(entanglement_pair)
+        if self.generated_entanglement_pairs.add(entanglement_pair, self.owner.timeline.now()):
             log.logger.info(f'{self.owner.name} added EP {entanglement_pair}')
         else:
             log.logger.warning(f'{self.owner.name} EP {entanglement_pair} already exist')
@@ -443,26 +947,16 @@ class AdaptiveContinuousWorker(Protocol):
             Tuple[(node_name, memory_name), (remote_node_name, remote_memory_name)] -- the freshest entanglement pair
             None -- if no match exist
         '''
-        entanglement_pairs = []
-        for entanglement_pair in sorted(self.generated_entanglement_pairs):
-            ent_this_node_name   = entanglement_pair[0][0]
-            ent_remote_node_name = entanglement_pair[1][0]
-            if ent_this_node_name == this_node_name and ent_remote_node_name == remote_node_name:
-                entanglement_pairs.append(entanglement_pair)
-        
+        entanglement_pairs = self.generated_entanglement_pairs.get_link(this_node_name, remote_node_name)  # sorted
         if len(entanglement_pairs) == 0:
             return None
 
         if self.strategy == "random":
             return entanglement_pairs[0]
         elif self.strategy == "freshest":
-            freshest_ep = None
-            best_fidelity = 0
-            for ep in entanglement_pairs:
-                fidelity = self.get_fidelity(ep)
-                if fidelity > best_fidelity:
-                    freshest_ep = ep
-                    best_fidelity = fidelity
+            freshest_ep = self.generated_entanglement_pairs.freshest(this_node_name, remote_node_name)
+            if freshest_ep is not None:
+                self.get_fidelity(freshest_ep)  # only the selected entanglement pair is brought up to date
             return freshest_ep
         else:
             raise Exception(f'{self.strategy} not supported')
@@ -493,53 +987,37 @@ class AdaptiveContinuousWorker(Protocol):
         Return:
             entanglement_pair or None
         '''
-        this_fidelity = 0
-        eps = []
-        this_node  = entanglement_pair[0][0]
-        other_node = entanglement_pair[1][0]
-        for ep in self.generated_entanglement_pairs:
-            if ep == entanglement_pair:
-                this_fidelity = self.get_fidelity(ep)
-            else:
-                if ep[0][0] == this_node and ep[1][0] == other_node:
-                    eps.append(ep)
-
-        if eps:
-            closest_ep = None
-            fidelity_difference = 1
-            for ep in eps:
-                fidelity = self.get_fidelity(ep)
-                difference = abs(this_fidelity - fidelity)
-                if difference < fidelity_difference:
-                    closest_ep = ep
-                    fidelity_difference = difference
-            return closest_ep
-        else:
-            return None
+        return self.generated_entanglement_pairs.closest(entanglement_pair, self.get_fidelity)
 
 
-    def adaptive_memory_used_minus_one(self, memory: Memory) -> None:
+    def adaptive_memory_used_minus_one(self, memory: Memory, reservation: ReservationAdaptive = None) -> None:
         '''reduce the self.adaptive_memory_used by 1. Called right after the entanglement generation protocol is expired
         Args:
             memory: this is the memory that is set to RAW (due to expired rule), released from the adaptive continuous protocol
+            reservation: the reservation that the memory was reserved for
         '''
         assert self.adaptive_memory_used > 0, f"{self.owner.name} adaptive_memory_used={self.adaptive_memory_used}"
         self.adaptive_memory_used -= 1
+        if reservation is not None:
+            neighbor = reservation.responder if reservation.initiator == self.owner.name else reservation.initiator
+            self.link_memory_used[neighbor] -= 1
         log.logger.debug(f'{self.owner.name} adaptive_memory_used is reduced from {self.adaptive_memory_used + 1} to {self.adaptive_memory_used}')
         # remove the entanglement pair that memory is in
-        ep_to_delete = None
-        for entanglement_pair in self.generated_entanglement_pairs:
-            if entanglement_pair[0][1] == memory.name:
-                ep_to_delete = entanglement_pair
-                break
-            elif entanglement_pair[1][1] == memory.name:
-                ep_to_delete = entanglement_pair
-                break
+        ep_to_delete = self.generated_entanglement_pairs.get_by_memory(memory.name)
         if ep_to_delete is None:  # the entanglement pair that includes argument memory doesn't exist, because the EP generation is not successfull yet
             log.logger.info(f'{self.owner.name} {memory.name} is not found in self.generated_entanglement_pairs!')
         else:
             self.generated_entanglement_pairs.remove(ep_to_delete)
             log.logger.info(f'{self.owner.name} removed EP {ep_to_delete}')
+        self.wakeup()
+
+
+    def wakeup(self) -> None:
+        '''resume the cycle paused by start() after a memory used by the adaptive continuous protocol is released
+        '''
+        if self.waiting_for_memory and self.adaptive_memory_used < self.adaptive_max_memory:
+            self.waiting_for_memory = False
+            self.start_delay(delay = self.delay_no_memory)
 
     def send_expire_rules_message(self, node: str, reservation: Reservation) -> None:
         '''send messages to node to expire the rules generated by reseravation
@@ -19,6 +19,7 @@ Optional Args:
         sync/async (bool): denotes if timelines should be synchronous (true) or not (false).
         lookahead (int): simulation lookahead time for timelines (in ps).
     -n --nodes (str): path to csv file providing process information for nodes.
+    -c --compact: write the "all_pairs_cchannels" directive instead of the O(N^2) explicit classical channels.
 """
 
 import argparse
@@ -115,6 +116,7 @@ def random_network():
     parser = argparse.ArgumentParser()
     parser.add_argument('net_size', type=int, help='number of network nodes')
     parser = add_default_args(parser)
+    parser.add_argument('-c', '--compact', action='store_true', help='write the all-pairs classical channel directive instead of the explicit classical channels')
     args = parser.parse_args()
 
     net_size = args.net_size
@@ -165,18 +167,19 @@ def random_network():
                           Topology.DISTANCE: round(distance / 2, 2),
                           Topology.ATTENUATION: args.qc_atten})
         # cchannels
-        cchannels.append({Topology.SRC: node1_name,
-                          Topology.DST: bsm_name,
-                          Topology.DELAY: args.cc_delay * 1e9})
-        cchannels.append({Topology.SRC: node2_name,
-                          Topology.DST: bsm_name,
-                          Topology.DELAY: args.cc_delay * 1e9})
-        cchannels.append({Topology.SRC: bsm_name,
-                          Topology.DST: node1_name,
-                          Topology.DELAY: args.cc_delay * 1e9})
-        cchannels.append({Topology.SRC: bsm_name,
-                          Topology.DST: node2_name,
-                          Topology.DELAY: args.cc_delay * 1e9})
+        if not args.compact:
+            cchannels.append({Topology.SRC: node1_name,
+                              Topology.DST: bsm_name,
+                              Topology.DELAY: args.cc_delay * 1e9})
+            cchannels.append({Topology.SRC: node2_name,
+                              Topology.DST: bsm_name,
+                              Topology.DELAY: args.cc_delay * 1e9})
+            cchannels.append({Topology.SRC: bsm_name,
+                              Topology.DST: node1_name,
+                              Topology.DELAY: args.cc_delay * 1e9})
+            cchannels.append({Topology.SRC: bsm_name,
+                              Topology.DST: node2_name,
+                              Topology.DELAY: args.cc_delay * 1e9})
         seed += 1
 
     # 1.3 generate the controller node
@@ -186,28 +189,33 @@ def random_network():
                         Topology.SEED: 0}
     nodes.insert(0, controller_node)
 
-    # 2.1 generate classical links between all node pairs
-    for i, node1_name in enumerate(router_names):
-        for node2_name in router_names[i+1:]:
-            cchannels.append({Topology.SRC: node1_name,
-                              Topology.DST: node2_name,
-                              Topology.DELAY: args.cc_delay * MILLISECOND})
-            cchannels.append({Topology.SRC: node2_name,
-                              Topology.DST: node1_name,
-                              Topology.DELAY: args.cc_delay * MILLISECOND})
-
-    # 2.2 generate controller-to-router classical links
-    controller2router_cchannels = []
-    for router_name in router_names:
-        controller2router_cchannels.append({Topology.SRC: controller_name,
-                                            Topology.DST: router_name,
-                                            Topology.DISTANCE: args.qc_length * 1000,
-                                            Topology.DELAY: args.cc_delay * MILLISECOND})
-        controller2router_cchannels.append({Topology.SRC: router_name,
-                                            Topology.DST: controller_name,
-                                            Topology.DISTANCE: args.qc_length * 1000,
-                                            Topology.DELAY: args.cc_delay * MILLISECOND})
-    cchannels += controller2router_cchannels
+    if args.compact:
+        # 2. the all-pairs classical links as a directive, expanded by the loader (RouterNetTopoAdaptive._add_cchannels)
+        output_dict['all_pairs_cchannels'] = {Topology.DISTANCE: args.qc_length * 1000,
+                                              Topology.DELAY: args.cc_delay * MILLISECOND}
+    else:
+        # 2.1 generate classical links between all node pairs
+        for i, node1_name in enumerate(router_names):
+            for node2_name in router_names[i+1:]:
+                cchannels.append({Topology.SRC: node1_name,
+                                  Topology.DST: node2_name,
+                                  Topology.DELAY: args.cc_delay * MILLISECOND})
+                cchannels.append({Topology.SRC: node2_name,
+                                  Topology.DST: node1_name,
+                                  Topology.DELAY: args.cc_delay * MILLISECOND})
+
+        # 2.2 generate controller-to-router classical links
+        controller2router_cchannels = []
+        for router_name in router_names:
+            controller2router_cchannels.append({Topology.SRC: controller_name,
+                                                Topology.DST: router_name,
+                                                Topology.DISTANCE: args.qc_length * 1000,
+                                                Topology.DELAY: args.cc_delay * MILLISECOND})
+            controller2router_cchannels.append({Topology.SRC: router_name,
+                                                Topology.DST: controller_name,
+                                                Topology.DISTANCE: args.qc_length * 1000,
+                                                Topology.DELAY: args.cc_delay * MILLISECOND})
+        cchannels += controller2router_cchannels
 
     nodes += bsm_nodes
     output_dict[Topology.ALL_NODE] = nodes
@@ -2,14 +2,13 @@
 This module defines the centralized controller.
 """
 
-from typing import List
 from networkx.classes.graph import Graph
 import numpy as np
 from sequence.topology.node import ClassicalNode
 from sequence.kernel.timeline import Timeline
 from adaptive_continuous_c import AdaptiveContinuousController
 from dqc_server import DQC_APP_Server
-from network_controller import NetworkController
+from network_controller import NetworkController, TrafficEstimator
 import sequence.utils.log as log
 from sequence.message import Message
 
@@ -26,24 +25,65 @@ class Controller(ClassicalNode):
         generator (rng): the random number generator from np
         adaptive_continuous_controller (AdaptiveContinuousController): the centralized controller
         graph (Graph): the graph topology of the network
+        memory_sizes (dict): router name -> number of memories at the router
         traffic (list): the traffic pattern, consist a list of (matrix, start_time, end_time)
+        online_period (int): if > 0, the probability tables are updated every online_period (ps) from the traffic estimated online,
+                             instead of the traffic pattern
     """
     def __init__(self, name: str, timeline: Timeline, seed: int):
         super().__init__(name, timeline)
         self.owner = self
         self.generator = np.random.default_rng(seed)
         self.graph: Graph = None
+        self.memory_sizes = {}  # router name -> number of memories
         self.traffic = []  # a list of tuples of (matrix, start_time, end_time)
         self.adaptive_continuous = AdaptiveContinuousController(self, f'{name}.acp')
         self.dqc_server: DQC_APP_Server = DQC_APP_Server(self)
         self.network_controller = NetworkController(self)
+        self.online_period = 0
 
     def init(self) -> None:
         """override init method
         """
-        self.adaptive_continuous.init(self.graph, self.traffic)
-        self.adaptive_continuous.init_prob_tables()
-        self.adaptive_continuous.send_probability_table()
+        self.adaptive_continuous.init(self.graph, self.traffic, self.memory_sizes)
+        if self.online_period > 0:
+            self.adaptive_continuous.start_online(self.online_period)
+        else:
+            self.adaptive_continuous.init_prob_tables()
+            self.adaptive_continuous.send_probability_table()
+            self.adaptive_continuous.send_memory_quota_schedule()
+
+    def set_memory_budget(self, memory_budget: int, memory_cap_ratio: float = 0.5) -> None:
+        """Let the controller allocate the memories of the adaptive continuous protocol to the routers and links from the traffic,
+           instead of the same adaptive_max_memory at every router
+
+        Args:
+            memory_budget (int): the total number of memories of the adaptive continuous protocol in the network
+            memory_cap_ratio (float): a router gives at most this ratio of its memories to the adaptive continuous protocol
+        """
+        self.adaptive_continuous.memory_budget = memory_budget
+        self.adaptive_continuous.memory_cap_ratio = memory_cap_ratio
+
+    def set_centralized_reservation(self, centralized: bool = True) -> None:
+        """Let the network controller reserve the paths of the requests, by asking all the nodes on a path in parallel,
+           instead of the hop-by-hop resource reservation protocol started by the src worker
+
+        Args:
+            centralized (bool): whether to use the centralized path reservation
+        """
+        self.network_controller.centralized_reservation = centralized
+
+    def set_online_traffic_estimation(self, period: int, half_life: int, capacity: int = 1000) -> None:
+        """Estimate the traffic from the served requests and update the probability tables from the estimation,
+           instead of the traffic pattern given by add_traffic()
+
+        Args:
+            period (int): the period (ps) of updating the probability tables
+            half_life (int): the half life (ps) of the decayed counters of the traffic estimator
+            capacity (int): the maximum number of (src, dst) pairs tracked by the traffic estimator
+        """
+        self.online_period = period
+        self.network_controller.traffic_estimator = TrafficEstimator(half_life, capacity)
 
     def set_seed(self, seed: int) -> None:
         """Set the seed, also set the generator
@@ -58,27 +98,29 @@ class Controller(ClassicalNode):
         """Get the seed"""
         return self.seed
 
-    def add_traffic(self, matrix: List[List], start_time: float, end_time: float):
+    def add_traffic(self, matrix: dict, start_time: float, end_time: float):
         """Inform the controller the traffic pattern
 
         Note: currently assuming static routing
         
         Attributes:
-            matrix (List[List]): the traffic matrix
+            matrix (dict): the (sparse) traffic matrix, (i, j) -> the probability of a request from router_i to router_j
             start_time (float): the start time of this traffic matrix
             end_time (float): the end time of this traffic matrix
         """
         self.traffic.append([matrix, start_time, end_time])
 
-    def received_message(self, src: str, msg: "Message"):
-        '''detemine what to do when a message is received, based on the msg.receiver
+    def receive_message(self, src: str, msg: "Message"):
+        '''override ClassicalNode.receive_message(), detemine what to do when a message is received, based on the msg.receiver
 
         Args:
             src (str): name of node that sends the message
             msg (Message): the message  
         '''
-        log.logger.info(f'{self.name} receive message {msg} from {src}')
+        log.logger.info('%s receive message %s from %s', self.name, msg, src)
         if msg.receiver == 'network_controller':
-            self.network_controller.received_message(msg)
+            self.network_controller.received_message(src, msg)
+        elif msg.receiver == 'adaptive_continuous':
+            self.adaptive_continuous.received_message(src, msg)
         else:
             raise Exception(f'receiver {msg.receiver} not supported')
@@ -5,6 +5,7 @@ from qutip_qip.circuit import QubitCircuit
 from typing import TYPE_CHECKING
 import numpy as np
 from collections import defaultdict, Counter
+from heapq import heappush, heappop
 
 from networkx.classes.coreviews import AdjacencyView
 from sequence.constants import EPSILON
@@ -25,12 +26,20 @@ class DQC_APP_Server:
         app_queue (list): a list of dqc applications
         num_qubit_per_worker (int): number of qubits per worker
         request_queue (list): a queue of requests
+        cached_graph (Graph): the graph of the cached node_order, nearest and best_workers
+        node_order (dict): node -> its index in the graph, the tie-breaking order of dijkstra
+        nearest (dict): start node -> (visited, dist), the longest dijkstra from the start node so far
+        best_workers (dict): num_workers -> the selected workers
     '''
     def __init__(self, owner: "Controller"):
         self.owner = owner
         self.app_queue = []
         self.num_qubit_per_worker = 0
         self.request_queue = []
+        self.cached_graph = None   # the graph of the cached results below
+        self.node_order = {}       # node -> index, the tie-breaking order of dijkstra
+        self.nearest = {}          # start node -> (visited, dist) of the longest dijkstra from start so far
+        self.best_workers = {}     # num_workers -> the selected workers
 
     def load(self, app_queue: list):
         '''load the DQC application queue
@@ -77,51 +86,84 @@ class DQC_APP_Server:
         Return:
             best_workers (list): a list of workers/nodes in the network
         '''
-        g = self.owner.graph.adj  # may use partial g if some nodes are not available
+        graph = self.owner.graph
+        if graph is not self.cached_graph:  # a new topology
+            self.reset_cache()
+            self.cached_graph = graph
+            self.node_order = {node: i for i, node in enumerate(graph.adj)}
+        if num_workers in self.best_workers:
+            return list(self.best_workers[num_workers])
+
+        g = graph.adj  # may use partial g if some nodes are not available
         best_total_distance = np.inf
         best_workers = None
-        for node in self.owner.graph.nodes:
-            workers, dist = self.dijkstra(g, node, num_workers)
+        for node in graph.nodes:
+            workers, dist = self.nearest_nodes(g, node, num_workers)
             total_dist = 0
             for worker in workers:
                 total_dist += dist[worker]
             if total_dist < best_total_distance:
                 best_workers = workers
                 best_total_distance = total_dist
-        return best_workers
-    
-    def dijkstra(self, g: AdjacencyView, start: str, num_workers: int) -> tuple:
-        '''do a dijkstra on a single node
+        self.best_workers[num_workers] = best_workers
+        return list(best_workers)
+
+    def nearest_nodes(self, g: AdjacencyView, start: str, num_workers: int) -> tuple:
+        '''the num_workers nodes closest to start (start included), reusing the dijkstra from start done for another app
 
         Args:
             g (AdjacencyView): the graph
             start (str): the starting node of dijkstra
+            num_workers (int): number of workers
         Return:
-            visited (list): a list of workers
+            visited (list): a list of workers, in the order of the distance
             dist (dict): distance dictionary
         '''
+        cached = self.nearest.get(start)
+        if cached is None or len(cached[0]) < num_workers:
+            cached = self.dijkstra(g, start, num_workers, self.node_order)
+            self.nearest[start] = cached
+        visited, dist = cached
+        # the first k nodes visited by dijkstra stopping at k are the same for any k, so a prefix of a longer run is reused
+        return visited[:num_workers], dist
+
+    def reset_cache(self):
+        '''forget the dijkstra results and the selected workers, needed when the graph changes
+        '''
+        self.cached_graph = None
+        self.node_order = {}
+        self.nearest = {}
+        self.best_workers = {}
+
+    def dijkstra(self, g: AdjacencyView, start: str, num_workers: int, order: dict = None) -> tuple:
+        '''do a dijkstra on a single node, stop when num_workers nodes are visited
+
+        Args:
+            g (AdjacencyView): the graph
+            start (str): the starting node of dijkstra
+            num_workers (int): number of workers
+            order (dict): node -> its index in g, breaks the ties of the distances
+        Return:
+            visited (list): a list of workers
+            dist (dict): distance dictionary, a node not in it has distance inf
+        '''
         assert num_workers <= len(g), f'num_workers={num_workers}, len(g)={len(g)}'
+        if order is None:
+            order = {node: i for i, node in enumerate(g)}
         visited = []
-        non_visited = []
-        dist = {}
-        for node in g:
-            non_visited.append(node)
-            dist[node] = np.inf
-        dist[start] = 0
-        while len(visited) < num_workers:
-            min_dist = np.inf
-            closest_node = None     # each round, one new node is added to the visited
-            for u in non_visited:
-                if dist[u] < min_dist:
-                    closest_node = u
-                    min_dist = dist[u]
-            u = closest_node
-            for v in g[u]:
-                u_v_weight = g[u][v]['weight']
-                if dist[u] + u_v_weight < dist[v]:
-                    dist[v] = dist[u] + u_v_weight
+        done = set()
+        dist = {start: 0}
+        heap = [(0, order[start], start)]  # ties are broken by the order of the nodes in the graph
+        while heap and len(visited) < num_workers:
+            d, _, u = heappop(heap)
+            if u in done:
+                continue
+            for v, attr in g[u].items():
+                if d + attr['weight'] < dist.get(v, np.inf):
+                    dist[v] = d + attr['weight']
+                    heappush(heap, (dist[v], order[v], v))
             visited.append(u)
-            non_visited.remove(u)
+            done.add(u)
         return visited, dist
 
     def generate_requests(self, app: DQC_APP, partitions: defaultdict[list], workers: list[str]) -> list:
@@ -0,0 +1,126 @@
+'''The inventory of entanglement pairs pre-generated by the adaptive continuous protocol
+'''
+
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Callable, Iterator, List, Optional
+
+
+class EntanglementPairInventory:
+    '''Track the entanglement pairs generated by the adaptive continuous protocol, indexed per link and per memory name.
+       An entanglement pair is a tuple ((node_name, memory_name), (remote_node_name, remote_memory_name))
+
+       On a link, the memories decohere the same way, so the later an entanglement pair is generated, the higher its fidelity now.
+       Each link also keeps its entanglement pairs ordered by generation time, so that the fidelities don't need to be computed for every pair
+
+    Attributes:
+        links (defaultdict[tuple, list]): (node_name, remote_node_name) -> sorted list of the entanglement pairs on this link
+        generations (defaultdict[tuple, list]): (node_name, remote_node_name) -> sorted list of (generation time, entanglement pair) on this link
+        generation_time (dict): entanglement pair -> the time when it is added
+        memory_to_pair (dict): memory_name -> the entanglement pair that includes the memory (both the local and remote memory names are indexed)
+    '''
+    def __init__(self):
+        self.links = defaultdict(list)
+        self.generations = defaultdict(list)
+        self.generation_time = {}
+        self.memory_to_pair = {}
+
+    def __len__(self) -> int:
+        return len(self.generation_time)
+
+    def __iter__(self) -> Iterator[tuple]:
+        for pairs in list(self.links.values()):
+            yield from list(pairs)
+
+    def __contains__(self, entanglement_pair: tuple) -> bool:
+        return self.memory_to_pair.get(entanglement_pair[0][1]) == entanglement_pair
+
+    def add(self, entanglement_pair: tuple, time: int) -> bool:
+        '''add an entanglement pair, O(log n) search
+
+        Args:
+            entanglement_pair: ((node_name, memory_name), (remote_node_name, remote_memory_name))
+            time: the time when the entanglement pair is generated
+        Return:
+            bool: False if the entanglement pair already exists
+        '''
+        if entanglement_pair in self:
+            return False
+        link = (entanglement_pair[0][0], entanglement_pair[1][0])
+        insort(self.links[link], entanglement_pair)
+        insort(self.generations[link], (time, entanglement_pair))
+        self.generation_time[entanglement_pair] = time
+        self.memory_to_pair[entanglement_pair[0][1]] = entanglement_pair
+        self.memory_to_pair[entanglement_pair[1][1]] = entanglement_pair
+        return True
+
+    def remove(self, entanglement_pair: tuple) -> None:
+        '''remove an entanglement pair
+
+        Side Effect:
+            Will raise KeyError when the entanglement pair doesn't exist
+        '''
+        if entanglement_pair not in self:
+            raise KeyError(entanglement_pair)
+        link = (entanglement_pair[0][0], entanglement_pair[1][0])
+        pairs = self.links[link]
+        del pairs[bisect_left(pairs, entanglement_pair)]
+        generations = self.generations[link]
+        del generations[bisect_left(generations, (self.generation_time.pop(entanglement_pair), entanglement_pair))]
+        if not pairs:
+            del self.links[link]
+            del self.generations[link]
+        for _, memory_name in entanglement_pair:
+            if self.memory_to_pair.get(memory_name) == entanglement_pair:
+                del self.memory_to_pair[memory_name]
+
+    def get_by_memory(self, memory_name: str) -> Optional[tuple]:
+        '''return the entanglement pair that includes the memory, None if the memory is not in any entanglement pair
+        '''
+        return self.memory_to_pair.get(memory_name)
+
+    def get_link(self, node_name: str, remote_node_name: str) -> List[tuple]:
+        '''return the entanglement pairs between node_name and remote_node_name, sorted. The returned list should not be modified
+        '''
+        return self.links.get((node_name, remote_node_name), [])
+
+    def freshest(self, node_name: str, remote_node_name: str) -> Optional[tuple]:
+        '''return the latest generated entanglement pair between node_name and remote_node_name, None if no pair exist.
+           Among the pairs generated at the same time, return the smallest one (in sorted order)
+
+        Args:
+            node_name: this node
+            remote_node_name: the remote node
+        '''
+        generations = self.generations.get((node_name, remote_node_name))
+        if not generations:
+            return None
+        latest_time = generations[-1][0]
+        return generations[bisect_left(generations, (latest_time,))][1]
+
+    def closest(self, entanglement_pair: tuple, get_fidelity: Callable[[tuple], float]) -> Optional[tuple]:
+        '''return the other entanglement pair on the same link whose fidelity now is the closest to entanglement_pair's (for purification),
+           None if no other pair exist. Only the pairs generated right before and right after entanglement_pair are candidates
+
+        Args:
+            entanglement_pair: ((node_name, memory_name), (remote_node_name, remote_memory_name)), its fidelity is 0 if it is not tracked
+            get_fidelity: return the fidelity of an entanglement pair now
+        '''
+        generations = self.generations.get((entanglement_pair[0][0], entanglement_pair[1][0]))
+        if not generations:
+            return None
+        if entanglement_pair not in self:
+            return generations[0][1]  # the oldest pair has the lowest fidelity
+        index = bisect_left(generations, (self.generation_time[entanglement_pair], entanglement_pair))
+        candidates = [generations[i][1] for i in (index - 1, index + 1) if 0 <= i < len(generations)]
+        if not candidates:
+            return None
+        this_fidelity = get_fidelity(entanglement_pair)
+        closest_ep = None
+        fidelity_difference = 1
+        for ep in sorted(candidates):
+            difference = abs(this_fidelity - get_fidelity(ep))
+            if difference < fidelity_difference:
+                closest_ep = ep
+                fidelity_difference = difference
+        return closest_ep
@@ -2,18 +2,24 @@
 """
 
 import argparse
+import logging
 import os
+import sys
+import traceback
 from collections import defaultdict
 
+import numpy as np
+
 import sequence.utils.log as log
 from sequence.constants import MILLISECOND, SECOND
 
 from router_net_topo_adaptive import RouterNetTopoAdaptive
 from request_app import RequestAppTimeToServe
-from traffic import TrafficMatrix
+from request_source import RequestSource
+from traffic import TrafficMatrix, request_array_to_queue
 
 
-def main():
+def parse_args(argv: list = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description='Parameters for Adaptive Continuous Protocol simulation')
     parser.add_argument('-tp', '--topology', type=str, default='line', help='topology, i.e. line, bottleneck, as')
     parser.add_argument('-n', '--node', type=int, default=5, help='number of nodes in the quantum network')
@@ -25,8 +31,74 @@ def main():
     parser.add_argument('-pf', '--purify', action='store_true', help='whether anable purification')
     parser.add_argument('-d', '--log_directory', type=str, default='log', help='the directory of the log')
     parser.add_argument('-s', '--strategy', type=str, default='freshest', help='the strategy of selecting one of the multiple entanglement pairs')
+    parser.add_argument('-bs', '--batch_size', type=int, default=1, help='the maximum number of memories the adaptive continuous protocol reserves with a neighbor in one cycle')
+    parser.add_argument('-lc', '--lazy_cchannels', action='store_true', help='create a classical channel the first time it is used')
+    parser.add_argument('-rg', '--request_generator', type=str, default='random', choices=['random', 'numpy'], \
+                        help='generate the requests by the random module, or all at once by numpy (the same seed gives different requests)')
+    parser.add_argument('-cd', '--cache_directory', type=str, default=None, help='the directory caching the routing of the topology (e.g. config/cache), no cache by default')
+    return parser.parse_args(argv)
+
+
+# the arguments that decide the topology built by build_topology(), the runs of a sweep with the same values share one topology
+TOPOLOGY_ARGS = ('topology', 'node', 'cache_directory', 'lazy_cchannels')
+
 
-    args = parser.parse_args()
+def build_topology(args: argparse.Namespace) -> RouterNetTopoAdaptive:
+    '''build the network from the config file, the part of a run that does not depend on the seeds and the protocol parameters
+    '''
+    network_config = f'config/{args.topology}_{args.node}.json'
+    return RouterNetTopoAdaptive(network_config, args.cache_directory, args.lazy_cchannels)
+
+
+def main():
+    args = parse_args()
+    run(build_topology(args), args)
+
+
+def sweep(argv_list: list, parallel: int = 8):
+    '''warm start for a sweep of runs: build each topology once in this process (before tl.init()),
+       then fork one child process per run, which applies its seeds and parameters to the (copied) topology and runs.
+       Results are the same as running main.py once per run. Needs os.fork(), i.e., Linux or macOS
+
+    Args:
+        argv_list: the arguments of each run, same as the command line arguments of main.py
+        parallel: the maximum number of child processes running at the same time
+    '''
+    groups = defaultdict(list)  # the values of TOPOLOGY_ARGS -> the args of the runs
+    for argv in argv_list:
+        args = parse_args(argv)
+        groups[tuple(getattr(args, name) for name in TOPOLOGY_ARGS)].append(args)
+
+    for runs in groups.values():
+        network_topo = build_topology(runs[0])
+        children = set()
+        for args in runs:
+            if len(children) >= parallel:
+                pid, _ = os.wait()
+                children.discard(pid)
+            sys.stdout.flush()
+            pid = os.fork()
+            if pid == 0:  # the child
+                status = 0
+                try:
+                    run(network_topo, args)
+                except Exception:
+                    traceback.print_exc()
+                    status = 1
+                finally:
+                    logging.shutdown()
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    os._exit(status)
+            children.add(pid)
+        while children:
+            pid, _ = os.wait()
+            children.discard(pid)
+
+
+def run(network_topo: RouterNetTopoAdaptive, args: argparse.Namespace):
+    '''apply the seeds and parameters to the network, generate the requests, and run the simulation
+    '''
     topology = args.topology
     node     = args.node
     time     = args.time
@@ -37,21 +109,23 @@ def main():
     purify          = args.purify
     log_directory   = args.log_directory
     strategy        = args.strategy
+    batch_size      = args.batch_size
+    request_generator = args.request_generator
 
     if os.path.exists(log_directory) is False:
-        os.mkdir(log_directory)
+        os.makedirs(log_directory, exist_ok=True)  # the children of a sweep may create it at the same time
 
     ##### 
     REQUEST_PERIOD = 0.1 # seconds, request incoming rate, assuming reqeust arrives one by one
     DELTA = 0.02         # seconds, time for EP pre-generation
     #####
 
-    network_config = f'config/{topology}_{node}.json'
-    network_topo = RouterNetTopoAdaptive(network_config)
     network_topo.update_stop_time(time * SECOND)
     tl = network_topo.get_timeline()
 
     log_filename = f'{log_directory}/{topology}{node},ma={memory_adaptive},up={update_prob},ns={node_seed},qs={queue_seed},s={strategy},pf={purify}'
+    if request_generator != 'random':
+        log_filename += f',rg={request_generator}'
     log.set_logger(__name__, tl, log_filename)
     log.set_logger_level('DEBUG')
     modules = ['main', 'purification', 'memory', 'generation', 'swapping', 'resource_manager']
@@ -69,6 +143,7 @@ def main():
         router.adaptive_continuous.has_empty_neighbor = True
         router.adaptive_continuous.update_prob = update_prob
         router.adaptive_continuous.strategy = strategy
+        router.adaptive_continuous.batch_size = batch_size
         router.adaptive_continuous.update_period(REQUEST_PERIOD * SECOND)
         router.resource_manager.purify = purify
 
@@ -84,16 +159,29 @@ def main():
     # request_queue = traffic_matrix.get_request_queue_tts(request_queue=request_queue, request_period=REQUEST_PERIOD, delta=DELTA, start_time=0, end_time=time, memo_size=1, fidelity=0.01, entanglement_number=1, seed=queue_seed)
 
     # for bottleneck and AS topology, update the traffic patter in at half time
-    traffic_matrix.set(topology, node, seed=0)
-    traffic_matrix.get_request_queue_tts(request_queue=request_queue, request_period=REQUEST_PERIOD, delta=DELTA, start_time=0,      end_time=time/2, memo_size=1, fidelity=0.01, entanglement_number=1, seed=queue_seed)
-    traffic_matrix.set(topology, node, seed=1)
-    traffic_matrix.get_request_queue_tts(request_queue=request_queue, request_period=REQUEST_PERIOD, delta=DELTA, start_time=time/2, end_time=time, memo_size=1, fidelity=0.01, entanglement_number=1, seed=queue_seed)
-
-    for request in request_queue:
+    if request_generator == 'numpy':
+        traffic_matrix.set(topology, node, seed=0)
+        requests1 = traffic_matrix.get_request_array_tts(request_period=REQUEST_PERIOD, delta=DELTA, start_time=0,      end_time=time/2, memo_size=1, fidelity=0.01, entanglement_number=1, seed=queue_seed)
+        traffic_matrix.set(topology, node, seed=1)
+        requests2 = traffic_matrix.get_request_array_tts(request_period=REQUEST_PERIOD, delta=DELTA, start_time=time/2, end_time=time, memo_size=1, fidelity=0.01, entanglement_number=1, seed=queue_seed, first_id=len(requests1))
+        request_queue = request_array_to_queue(np.concatenate([requests1, requests2]))  # the tuples are created lazily, when the requests are injected
+    else:
+        traffic_matrix.set(topology, node, seed=0)
+        traffic_matrix.get_request_queue_tts(request_queue=request_queue, request_period=REQUEST_PERIOD, delta=DELTA, start_time=0,      end_time=time/2, memo_size=1, fidelity=0.01, entanglement_number=1, seed=queue_seed)
+        traffic_matrix.set(topology, node, seed=1)
+        traffic_matrix.get_request_queue_tts(request_queue=request_queue, request_period=REQUEST_PERIOD, delta=DELTA, start_time=time/2, end_time=time, memo_size=1, fidelity=0.01, entanglement_number=1, seed=queue_seed)
+
+    def start_request(request: tuple):
         id, src_name, dst_name, start_time, end_time, memo_size, fidelity, entanglement_number = request
         app = name_to_apps[src_name]
         app.start(dst_name, start_time, end_time, memo_size, fidelity, entanglement_number, id)
 
+    # a request is injected LEAD_TIME before it starts. The lead time is 2 periods of the adaptive continuous protocol,
+    # so the AC protocol's reservations made before the injection end before the request starts
+    LEAD_TIME = round(2 * REQUEST_PERIOD * SECOND)
+    request_source = RequestSource(tl, start_request, lambda request: request[3] - LEAD_TIME)
+    request_source.add(request_queue)
+
     tl.init()
     tl.run()
 
@@ -5,17 +5,24 @@ in SeQUeNCe and conduct experiments with a large number of nodes.
 
 import logging
 import argparse
-from collections import defaultdict
+from collections import defaultdict, Counter
 import numpy as np
 from sequence.topology.router_net_topo import RouterNetTopo
 from sequence.constants import MILLISECOND
 from sequence.constants import SECOND
+from sequence.kernel.timeline import Timeline
+from sequence.kernel.process import Process
+from sequence.kernel.event import Event
 import sequence.utils.log as log
-from request_app import RequestAppThroughput, RequestAppTimeToServe
+from request_app import RequestAppThroughput, RequestAppTimeToServe, RequestAppConcurrent
 from router_net_topo_adaptive import RouterNetTopoAdaptive
-from traffic import TrafficMatrix
+from node import QuantumRouterAdaptive
+from adaptive_continuous import ProbabilityTableEngine, AdaptiveContinuousMessage, ACMsgType, PathCache
+from reservation import ReservationAdaptive
+from traffic import TrafficMatrix, request_array_to_queue
 from dqc_app import DQC_APP_Queue
 from controller import Controller
+from request_source import RequestSource
 
 
 # linear network topology + entanglement generation (based on 20 samples)
@@ -700,6 +707,319 @@ def app_10_node_random_request2_dqc():
 
 
 
+def run_10_node_random_request2_dqc(log_filename: str, centralized_reservation: bool = False) -> list:
+    '''run the setting of app_10_node_random_request2_dqc()
+
+    Args:
+        log_filename: the log file
+        centralized_reservation: if True, the network controller reserves the paths of the requests (Controller.set_centralized_reservation())
+    Return:
+        list: (reservation, time to serve, fidelity) sorted by reservation
+    '''
+    np.random.seed(0)
+    REQUEST_PERIOD = 1 # seconds
+
+    network_topo = RouterNetTopoAdaptive('config/random_10.json')
+    tl = network_topo.get_timeline()
+    log.set_logger(__name__, tl, log_filename)
+    log.set_logger_level('INFO')
+    log.track_module('main_test')
+
+    name_to_apps = {}
+    for router in network_topo.get_nodes_by_type(RouterNetTopo.QUANTUM_ROUTER):
+        app = RequestAppTimeToServe(router)
+        name_to_apps[router.name] = app
+        router.adaptive_continuous.has_empty_neighbor = True
+        router.adaptive_continuous.update_prob = True
+        router.adaptive_continuous.strategy = 'freshest'
+        router.adaptive_continuous.update_period(REQUEST_PERIOD * SECOND)
+        router.resource_manager.purify = False
+
+    controller: Controller = network_topo.get_nodes_by_type(RouterNetTopo.CONTROLLER)[0]
+    controller.set_centralized_reservation(centralized_reservation)
+    controller.dqc_server.num_qubit_per_worker = 4
+    dqc_app_queue = DQC_APP_Queue.generate_random_queue(10, 10, 11, 0.1, REQUEST_PERIOD)
+    controller.dqc_server.load(dqc_app_queue)
+    controller.dqc_server.generate_network_request()
+
+    tl.init()
+    tl.run()
+
+    time_to_serve_dict = defaultdict(float)
+    fidelity_dict = defaultdict(list)
+    for _, app in name_to_apps.items():
+        time_to_serve_dict |= app.time_to_serve
+        fidelity_dict |= app.entanglement_fidelities
+    return [(str(reservation), time_to_serve, fidelity_dict[reservation][0]) for reservation, time_to_serve in sorted(time_to_serve_dict.items())]
+
+
+# the same as app_10_node_random_request2_dqc(), but the network controller reserves the path of each request by asking all the nodes on the path in parallel,
+# instead of the hop-by-hop resource reservation started by the src worker. The reservations are done before the requests start, so the results are the same
+def app_10_node_random_request2_dqc_centralized():
+
+    results = run_10_node_random_request2_dqc('log/tmp/random10,numqubit=14,centralized', centralized_reservation=True)
+    results_distributed = run_10_node_random_request2_dqc('log/tmp/random10,numqubit=14,distributed', centralized_reservation=False)
+
+    assert results == results_distributed, 'the centralized reservation should serve the requests the same as the distributed reservation'
+    for reservation, time_to_serve, fidelity in results:
+        log.logger.info(f'reservation={reservation}, time to serve={time_to_serve / MILLISECOND}, fidelity={fidelity:.6f}')
+    print(f'{len(results)} requests served, the centralized reservation is the same as the distributed reservation')
+
+
+# the same as app_10_node_random_request2_dqc(), but with RequestAppConcurrent,
+# i.e., a worker serves several overlapping requests of a DQC app, and each request is accounted separately
+def app_10_node_random_request2_dqc_concurrent():
+
+    np.random.seed(0)
+    REQUEST_PERIOD = 1 # seconds, request incoming rate, assuming reqeust arrives one by one
+
+    purify = False
+    strategy = 'freshest'
+    log_filename = 'log/tmp/random10,numqubit=14,concurrent'
+    
+    network_config = 'config/random_10.json'
+
+    network_topo = RouterNetTopoAdaptive(network_config)
+    
+    tl = network_topo.get_timeline()
+
+    log.set_logger(__name__, tl, log_filename)
+    log.set_logger_level('INFO')
+    modules = ['main_test']
+    for module in modules:
+        log.track_module(module)
+
+    name_to_apps = {}
+    for router in network_topo.get_nodes_by_type(RouterNetTopo.QUANTUM_ROUTER):
+        app = RequestAppConcurrent(router)
+        name_to_apps[router.name] = app
+        router.adaptive_continuous.has_empty_neighbor = True
+        router.adaptive_continuous.update_prob = True
+        router.adaptive_continuous.strategy = strategy
+        router.adaptive_continuous.update_period(REQUEST_PERIOD * SECOND)
+        router.resource_manager.purify = purify
+
+    controller: Controller = None
+    for con in network_topo.get_nodes_by_type(RouterNetTopo.CONTROLLER):
+        controller = con
+        break
+
+    controller.dqc_server.num_qubit_per_worker = 4
+    queue_length = 10
+    num_qubits_lower = 10
+    num_qubits_upper = 11
+    start_time = 0.1
+    app_period = REQUEST_PERIOD
+    dqc_app_queue = DQC_APP_Queue.generate_random_queue(queue_length, num_qubits_lower, num_qubits_upper, start_time, app_period)
+    controller.dqc_server.load(dqc_app_queue)
+    controller.dqc_server.generate_network_request()
+
+    tl.init()
+    tl.run()
+
+    time_to_serve_dict = defaultdict(float)
+    fidelity_dict = defaultdict(list)
+    for _, app in name_to_apps.items():
+        time_to_serve_dict |= app.time_to_serve
+        fidelity_dict |= app.entanglement_fidelities
+
+    for reservation, time_to_serve in sorted(time_to_serve_dict.items()):
+        fidelity = fidelity_dict[reservation][0]
+        log.logger.info(f'reservation={reservation}, time to serve={time_to_serve / MILLISECOND}, fidelity={fidelity:.6f}')
+
+
+class ProbabilityTableChecker:
+    '''check the probability tables of the workers every period, after a quantum link is removed
+
+    Attributes:
+        timeline (Timeline): the simulation timeline
+        routers (list): the routers (workers)
+        link (tuple): the two router names of the removed link
+        period (int): the period (ps) of the check
+        check_count (int): the number of checks done
+    '''
+    def __init__(self, timeline, routers: list, link: tuple, period: int):
+        self.timeline = timeline
+        self.routers = routers
+        self.link = link
+        self.period = period
+        self.check_count = 0
+
+    def check(self):
+        '''the ends of the removed link don't have each other in the table, and every table sums to 1
+        '''
+        for router in self.routers:
+            table = router.adaptive_continuous.probability_table
+            assert abs(sum(table.values()) - 1) < 1e-9, f'{router.name} probability table {table} does not sum to 1'
+            if router.name in self.link:
+                removed_neighbor = self.link[1] if router.name == self.link[0] else self.link[0]
+                assert removed_neighbor not in table, f'{router.name} probability table {table} has the removed neighbor {removed_neighbor}'
+        self.check_count += 1
+        process = Process(self, 'check', [])
+        self.timeline.schedule(Event(self.timeline.now() + self.period, process))
+
+
+# remove a quantum link in the middle of the simulation, testing on a 10 node random network,
+# the workers' probability tables never have the removed neighbor after the controller's full tables arrive, and always sum to 1
+def app_10_node_random_link_failure():
+
+    REQUEST_PERIOD = 0.1  # seconds
+    DELTA = 0.02          # seconds, time for EP pre-generation
+    REMOVE_TIME = 1       # seconds, the time to remove the link
+
+    log_filename = 'log/tmp/random10,link_failure'
+    network_config = 'config/random_10.json'
+
+    network_topo = RouterNetTopoAdaptive(network_config)
+    network_topo.update_stop_time(4 * SECOND)
+    tl = network_topo.get_timeline()
+
+    log.set_logger(__name__, tl, log_filename)
+    log.set_logger_level('INFO')
+    modules = ['main_test']
+    for module in modules:
+        log.track_module(module)
+
+    routers = network_topo.get_nodes_by_type(RouterNetTopo.QUANTUM_ROUTER)
+    name_to_apps = {}
+    for router in routers:
+        app = RequestAppTimeToServe(router)
+        name_to_apps[router.name] = app
+        router.adaptive_continuous.update_period(REQUEST_PERIOD * SECOND)
+
+    controller: Controller = network_topo.get_nodes_by_type(RouterNetTopo.CONTROLLER)[0]
+    controller.adaptive_continuous.method = 'traffic'
+
+    # two traffic matrices, the link failure happens in the first one, and the second one is rescheduled
+    request_queue = []
+    traffic_matrix = TrafficMatrix(len(routers))
+    traffic_matrix.matrix[0, 5] = 0.5
+    traffic_matrix.matrix[3, 8] = 0.5
+    traffic_matrix.get_request_queue_tts(request_queue, REQUEST_PERIOD, DELTA, 0, 2, 1, 0.6, 3, seed=0, controller=controller)
+    traffic_matrix = TrafficMatrix(len(routers))
+    traffic_matrix.matrix[0, 5] = 0.6
+    traffic_matrix.matrix[1, 9] = 0.4
+    traffic_matrix.get_request_queue_tts(request_queue, REQUEST_PERIOD, DELTA, 2, 4, 1, 0.6, 3, seed=1, controller=controller)
+    for request in request_queue:
+        id, src_name, dst_name, start_time, end_time, memo_size, fidelity, entanglement_number = request
+        app = name_to_apps[src_name]
+        app.start(dst_name, start_time, end_time, memo_size, fidelity, entanglement_number, id)
+
+    # remove the first link on the path router_0 -> router_5, which is in the traffic of both matrices
+    router_0 = name_to_apps['router_0'].node
+    link = ('router_0', router_0.network_manager.protocol_stack[0].get_forwarding_table()['router_5'])
+    process = Process(network_topo, 'remove_quantum_link', list(link))
+    tl.schedule(Event(REMOVE_TIME * SECOND, process))
+    # start checking after the full tables from the controller arrive
+    delay = max(controller.cchannels[router_name].delay for router_name in link)
+    checker = ProbabilityTableChecker(tl, routers, link, MILLISECOND)
+    process = Process(checker, 'check', [])
+    tl.schedule(Event(REMOVE_TIME * SECOND + delay + 1, process))
+
+    tl.init()
+    tl.run()
+
+    log.logger.info(f'removed link={link}, probability tables checked {checker.check_count} times')
+    time_to_serve_dict = defaultdict(float)
+    for _, app in name_to_apps.items():
+        time_to_serve_dict |= app.time_to_serve
+    for reservation, time_to_serve in sorted(time_to_serve_dict.items()):
+        log.logger.info(f'reservation={reservation}, time to serve={time_to_serve / MILLISECOND}')
+
+
+def run_10_node_random_request2_traffic(log_filename: str, use_ticker: bool = True, lazy: bool = False) -> tuple:
+    '''run the time-to-serve requests of two traffic matrices on a 10 node random network, the controller computes the probability tables from the traffic
+
+    Args:
+        log_filename: the log file
+        use_ticker: if False, the controller and the workers don't use the network's ticker
+        lazy: if True, a RequestSource injects each request two AC periods before it starts (same as main.py), otherwise all the requests start at the beginning
+    Return:
+        tuple: a list of (reservation, time to serve) sorted by reservation, and the number of events executed
+    '''
+    REQUEST_PERIOD = 0.1  # seconds
+    DELTA = 0.02          # seconds, time for EP pre-generation
+
+    network_topo = RouterNetTopoAdaptive('config/random_10.json')
+    network_topo.update_stop_time(4 * SECOND)
+    tl = network_topo.get_timeline()
+    log.set_logger(__name__, tl, log_filename)
+    log.set_logger_level('INFO')
+    log.track_module('main_test')
+
+    routers = network_topo.get_nodes_by_type(RouterNetTopo.QUANTUM_ROUTER)
+    name_to_apps = {}
+    for router in routers:
+        app = RequestAppTimeToServe(router)
+        name_to_apps[router.name] = app
+        router.adaptive_continuous.adaptive_max_memory = 4
+        router.adaptive_continuous.update_period(REQUEST_PERIOD * SECOND)
+        if not use_ticker:
+            router.adaptive_continuous.ticker = None
+
+    controller: Controller = network_topo.get_nodes_by_type(RouterNetTopo.CONTROLLER)[0]
+    controller.adaptive_continuous.method = 'traffic'
+    if not use_ticker:
+        controller.adaptive_continuous.ticker = None
+
+    request_queue = []
+    traffic_matrix = TrafficMatrix(len(routers))
+    traffic_matrix.matrix[0, 5] = 0.5
+    traffic_matrix.matrix[3, 8] = 0.5
+    traffic_matrix.get_request_queue_tts(request_queue, REQUEST_PERIOD, DELTA, 0, 2, 1, 0.6, 3, seed=0, controller=controller)
+    traffic_matrix = TrafficMatrix(len(routers))
+    traffic_matrix.matrix[2, 7] = 0.6
+    traffic_matrix.matrix[1, 9] = 0.4
+    traffic_matrix.get_request_queue_tts(request_queue, REQUEST_PERIOD, DELTA, 2, 4, 1, 0.6, 3, seed=1, controller=controller)
+
+    def start_request(request: tuple):
+        id, src_name, dst_name, start_time, end_time, memo_size, fidelity, entanglement_number = request
+        app = name_to_apps[src_name]
+        app.start(dst_name, start_time, end_time, memo_size, fidelity, entanglement_number, id)
+
+    if lazy:
+        LEAD_TIME = round(2 * REQUEST_PERIOD * SECOND)
+        request_source = RequestSource(tl, start_request, lambda request: request[3] - LEAD_TIME)
+        request_source.add(request_queue)
+    else:
+        for request in request_queue:
+            start_request(request)
+
+    tl.init()
+    tl.run()
+
+    time_to_serve_dict = defaultdict(float)
+    for _, app in name_to_apps.items():
+        time_to_serve_dict |= app.time_to_serve
+    results = [(str(reservation), time_to_serve) for reservation, time_to_serve in sorted(time_to_serve_dict.items())]
+    return results, tl.run_counter
+
+
+# the ticker of RouterNetTopoAdaptive is shared by the controller and the workers, it coalesces the workers' start events
+# and the ends of the AC reservations (a multiple of the AC period) of all the nodes into one event per time,
+# testing on a 10 node random network with the controller's traffic tables, with and without the ticker, the results are the same with fewer events
+def app_10_node_random_ticker():
+
+    results, event_count = run_10_node_random_request2_traffic('log/tmp/random10,ticker', use_ticker=True)
+    results_no_ticker, event_count_no_ticker = run_10_node_random_request2_traffic('log/tmp/random10,no_ticker', use_ticker=False)
+
+    assert results == results_no_ticker, 'the ticker should not change the results'
+    assert event_count < event_count_no_ticker, f'events with the ticker={event_count}, without={event_count_no_ticker}'
+    log.logger.info(f'{len(results)} requests served, events with the ticker={event_count}, without the ticker={event_count_no_ticker}')
+    print(f'{len(results)} requests served, events with the ticker={event_count}, without the ticker={event_count_no_ticker}')
+
+
+# the requests are injected lazily by a RequestSource, two AC periods before each request starts, instead of all at the beginning,
+# testing on a 10 node random network with the controller's traffic tables, the results are the same as starting all the requests upfront
+def app_10_node_random_request_source():
+
+    results, _ = run_10_node_random_request2_traffic('log/tmp/random10,request_source', lazy=True)
+    results_eager, _ = run_10_node_random_request2_traffic('log/tmp/random10,eager', lazy=False)
+
+    assert results == results_eager, 'injecting the requests lazily should not change the results'
+    log.logger.info(f'{len(results)} requests served, the same as starting all the requests upfront')
+    print(f'{len(results)} requests served, the same as starting all the requests upfront')
+
 # the request type-2 app, testing on a twenty node bottleneck network, for time-to-serve
 def app_20_node_bottleneck_request2_queue():
 
@@ -859,6 +1179,181 @@ def app_100_node_as_request2_queue():
 
 
 
+# the vectorized request generator (main.py --request_generator numpy), compared with the legacy generator get_request_queue_tts()
+# the same seed gives the same requests, the ids and times are the same as the legacy queue, and the src-dst frequencies follow the matrix
+def traffic_request_array_tts():
+
+    REQUEST_PERIOD = 0.1  # seconds
+    DELTA = 0.02          # seconds, time for EP pre-generation
+    END_TIME = 2000       # seconds, 20000 requests
+
+    traffic_matrix = TrafficMatrix(20)
+    traffic_matrix.set('bottleneck', 20, seed=0)
+
+    requests = traffic_matrix.get_request_array_tts(REQUEST_PERIOD, DELTA, 0, END_TIME, 1, 0.6, 1, seed=0)
+    requests_same_seed = traffic_matrix.get_request_array_tts(REQUEST_PERIOD, DELTA, 0, END_TIME, 1, 0.6, 1, seed=0)
+    requests_other_seed = traffic_matrix.get_request_array_tts(REQUEST_PERIOD, DELTA, 0, END_TIME, 1, 0.6, 1, seed=1)
+    assert np.array_equal(requests, requests_same_seed), 'the same seed should give the same requests'
+    assert not np.array_equal(requests, requests_other_seed), 'different seeds should give different requests'
+
+    # the legacy generator accumulates the request period, so its times drift by the floating point error (< 1 ns here)
+    request_queue = traffic_matrix.get_request_queue_tts([], REQUEST_PERIOD, DELTA, 0, END_TIME, 1, 0.6, 1, seed=0)
+    assert len(request_queue) == len(requests)
+    for request, legacy_request in zip(request_array_to_queue(requests), request_queue):
+        id, _, _, start_time, end_time, memo_size, fidelity, entanglement_number = request
+        assert (id, memo_size, fidelity, entanglement_number) == (legacy_request[0], legacy_request[5], legacy_request[6], legacy_request[7])
+        assert abs(start_time - legacy_request[3]) < 1000 and abs(end_time - legacy_request[4]) < 1000, f'{request}, {legacy_request}'
+
+    # the frequency of each src-dst pair is within 4 standard deviations of the binomial distribution
+    src_dst_pairs, prob_list = traffic_matrix.matrix_to_prob_list()
+    total_prob = sum(prob_list)
+    number = len(requests)
+    for (src, dst), prob in zip(src_dst_pairs, prob_list):
+        p = prob / total_prob
+        count = int(np.count_nonzero((requests['src'] == src) & (requests['dst'] == dst)))
+        assert abs(count - number * p) <= 4 * np.sqrt(number * p * (1 - p)), f'({src}, {dst}) count={count}, expected={number * p:.1f}'
+    print(f'{number} requests, {len(src_dst_pairs)} src-dst pairs, the vectorized request generator is ok')
+
+
+# PathCache keeps the entanglement paths of the AC protocol in a sliding window with a counter per neighbor,
+# it replaces a list of (timestamp, path) that was scanned at every update of the probability table.
+# testing on random paths whose timestamps are up to one window in the past, PathCache gives the same neighbors as the list
+def path_cache_check():
+
+    WINDOW = 100
+    node_name = 'router_0'
+    nodes = [f'router_{i}' for i in range(6)]
+    generator = np.random.default_rng(0)
+
+    def get_neighbors_list(list_cache: list, time: int) -> Counter:
+        '''the neighbors next to node_name in the paths of the list cache whose timestamp is at least time, the same scan as the list cache'''
+        neighbors = Counter()
+        for timestamp, path in list_cache:
+            if time <= timestamp and node_name in path:
+                this_index = path.index(node_name)
+                neighbors.update({path[i] for i in (this_index - 1, this_index + 1) if 0 <= i < len(path)})
+        return neighbors
+
+    path_cache = PathCache(node_name, WINDOW)
+    list_cache = []
+    now = 0
+    for _ in range(5000):
+        now += int(generator.integers(WINDOW // 5))
+        if generator.random() < 0.8:    # add an entanglement path
+            timestamp = now - int(generator.integers(WINDOW))
+            path = [str(node) for node in generator.choice(nodes, size=generator.integers(2, 5), replace=False)]
+            path_cache.add(timestamp, path)
+            list_cache.append((timestamp, path))
+        else:                           # update the probability table
+            path_cache.evict(now - WINDOW)
+            neighbors = get_neighbors_list(list_cache, now - WINDOW)
+            assert path_cache.get_neighbors() == set(neighbors), f'{now}: {path_cache.get_neighbors()} != {set(neighbors)}'
+            assert path_cache.neighbor_count == neighbors, f'{now}: {path_cache.neighbor_count} != {neighbors}'
+            assert len(path_cache) <= len(list_cache)
+    print(f'{len(list_cache)} paths, the path cache keeps {len(path_cache)}, the neighbors are the same as the list cache')
+
+
+class ProbabilityTableEngineChecker:
+    '''feed the same entanglement paths to two copies of the routers, the first copy updates its own probability tables,
+       the second copy is on a ProbabilityTableEngine. Check that the tables of the two copies are the same after every update
+
+    Attributes:
+        timeline (Timeline): the simulation timeline
+        copies (list): two dicts of router index -> router, the scalar copy and the engine copy
+        edges (list): the quantum links, (router index, router index)
+        period (int): the period (ps) of the update
+        generator (np.random.Generator): the random generator for the paths
+        path_count (int): the number of paths fed
+        check_count (int): the number of checks done
+    '''
+    def __init__(self, timeline, copies: list, edges: list, period: int, seed: int):
+        self.timeline = timeline
+        self.copies = copies
+        self.edges = edges
+        self.period = period
+        self.generator = np.random.default_rng(seed)
+        self.path_count = 0
+        self.check_count = 0
+
+    def feed(self):
+        '''every node in a random walk path receives the path, the timestamp is up to one period ago.
+           The feeds are at odd multiples of period / 20, so they never coincide with the updates or the checks
+        '''
+        path = list(self.edges[self.generator.integers(len(self.edges))])
+        for _ in range(self.generator.integers(3)):
+            next_hops = [v for u, v in self.edges if u == path[-1] and v not in path] + [u for u, v in self.edges if v == path[-1] and u not in path]
+            if not next_hops:
+                break
+            path.append(next_hops[self.generator.integers(len(next_hops))])
+        timestamp = self.timeline.now() - int(self.generator.integers(self.period))
+        for routers in self.copies:
+            names = [routers[index].name for index in path]
+            reservation = ReservationAdaptive(names[0], names[-1], timestamp, timestamp + self.period, memory_size=1, fidelity=0.9)
+            reservation.set_path(names)
+            for index in path:
+                msg = AdaptiveContinuousMessage(ACMsgType.CACHE, reservation, timestamp=timestamp)
+                routers[index].adaptive_continuous.received_message(names[0], msg)
+        self.path_count += 1
+        process = Process(self, 'feed', [])
+        self.timeline.schedule(Event(self.timeline.now() + self.period // 10, process))
+
+    def check(self):
+        '''the probability tables of the two copies are the same
+        '''
+        scalar_routers, engine_routers = self.copies
+        for index, router in scalar_routers.items():
+            table = router.adaptive_continuous.get_probability_table()
+            engine_table = engine_routers[index].adaptive_continuous.get_probability_table()
+            engine_table = {neighbor.replace('engine_router', 'router'): prob for neighbor, prob in engine_table.items()}
+            assert table.keys() == engine_table.keys(), f'{router.name} {table} != {engine_table}'
+            for neighbor, prob in table.items():
+                assert abs(prob - engine_table[neighbor]) < 1e-9, f'{router.name} {table} != {engine_table}'
+        self.check_count += 1
+        process = Process(self, 'check', [])
+        self.timeline.schedule(Event(self.timeline.now() + self.period, process))
+
+
+# the ProbabilityTableEngine updates the probability tables of the distributed AdaptiveContinuousProtocol in one batch per period,
+# testing on two copies of a six node network (without quantum channels) that receive the same entanglement paths, the tables are the same
+def probability_table_engine_check():
+
+    PERIOD = 100 * MILLISECOND
+    END_TIME = 5 * SECOND
+
+    tl = Timeline(END_TIME)
+    edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (1, 4), (0, 5)]
+    engine = ProbabilityTableEngine(tl, PERIOD)
+    copies = []
+    for prefix in ['router', 'engine_router']:
+        routers = {}
+        for index in range(6):
+            router = QuantumRouterAdaptive(f'{prefix}_{index}', tl, 4, index, {'adaptive_max_memory': 2})
+            router.active = False  # no entanglement generation, only the probability tables
+            router.adaptive_continuous.update_period(PERIOD)
+            router.adaptive_continuous.has_empty_neighbor = index != 2
+            router.adaptive_continuous.update_prob = index != 5
+            if prefix == 'engine_router':
+                router.adaptive_continuous.engine = engine
+            routers[index] = router
+        for u, v in edges:
+            routers[u].network_manager.protocol_stack[0].add_forwarding_rule(routers[v].name, routers[v].name)
+            routers[v].network_manager.protocol_stack[0].add_forwarding_rule(routers[u].name, routers[u].name)
+        copies.append(routers)
+
+    checker = ProbabilityTableEngineChecker(tl, copies, edges, PERIOD, seed=0)
+    tl.schedule(Event(PERIOD // 20, Process(checker, 'feed', [])))
+    tl.schedule(Event(PERIOD // 2, Process(checker, 'check', [])))
+
+    tl.init()
+    for routers in copies:
+        for router in routers.values():
+            router.adaptive_continuous.init()
+    tl.run()
+
+    assert checker.check_count == END_TIME // PERIOD
+    print(f'{checker.path_count} paths, the probability tables are checked {checker.check_count} times, the engine is the same as the scalar update')
+
+
 if __name__ == '__main__':
     verbose = True
     # linear_entanglement_generation(verbose)
@@ -868,6 +1363,14 @@ if __name__ == '__main__':
 
     # app_2_node_line_request2_dqc()
     app_10_node_random_request2_dqc()
+    # app_10_node_random_request2_dqc_centralized()
+    # app_10_node_random_request2_dqc_concurrent()
+    # app_10_node_random_link_failure()
+    # app_10_node_random_ticker()
+    # app_10_node_random_request_source()
+    # traffic_request_array_tts()
+    # path_cache_check()
+    # probability_table_engine_check()
 
     # app_5_node_linear_adaptive(verbose)
     # app_5_node_line_request2_queue()
@@ -2,13 +2,15 @@
    and talk to the workers about the requests
 '''
 
+import math
 from enum import Enum, auto
-from typing import TYPE_CHECKING
+from heapq import heappush, heappop, heapify
+from typing import TYPE_CHECKING, Optional
 from sequence.message import Message
-from sequence.kernel.event import Event
-from sequence.kernel.process import Process
 from sequence.constants import SECOND
+from sequence.network_management.reservation import Reservation
 import sequence.utils.log as log
+from request_source import RequestSource
 
 
 if TYPE_CHECKING:
@@ -20,6 +22,10 @@ class NetControllerMsgType(Enum):
     '''
     REQUEST = auto()   # request a worker to start EP generation
     RESPOND = auto()   # worker finish the EP generation and respond to the network controller
+    RESERVE = auto()          # centralized path reservation: ask a node on the path to schedule the reservation on its memories
+    RESERVE_RESULT = auto()   # centralized path reservation: the node tells the network controller whether the schedule succeeded
+    APPROVE = auto()          # centralized path reservation: every node on the path is scheduled, load the rules
+    CANCEL = auto()           # centralized path reservation: some node on the path failed, release the memories
 
 
 class NetControllerMessage(Message):
@@ -27,47 +33,229 @@ class NetControllerMessage(Message):
     '''
     def __init__(self, msg_type: NetControllerMsgType, receiver: str, **kwargs):
         super().__init__(msg_type, receiver=receiver)
-        self.string = f'type={msg_type.name}, receiver={receiver}'
 
         if self.msg_type == NetControllerMsgType.REQUEST:
             self.request = kwargs['request']
             self.request_counter = kwargs['request_counter']
-            self.string += f', request={self.request}, request_counter={self.request_counter}'
         elif self.msg_type == NetControllerMsgType.RESPOND:
             self.respond = kwargs['respond']
-            self.string += f', respond={self.respond}'
+            self.reservation = kwargs.get('reservation')  # the reservation of the served request
+        elif self.msg_type == NetControllerMsgType.RESERVE:
+            self.reservation = kwargs['reservation']
+        elif self.msg_type == NetControllerMsgType.RESERVE_RESULT:
+            self.reservation = kwargs['reservation']
+            self.result = kwargs['result']
+        elif self.msg_type in (NetControllerMsgType.APPROVE, NetControllerMsgType.CANCEL):
+            self.reservation = kwargs['reservation']
+            self.path = kwargs['path']
     
     def __str__(self):
-        return self.string
+        string = f'type={self.msg_type.name}, receiver={self.receiver}'
+        if self.msg_type == NetControllerMsgType.REQUEST:
+            string += f', request={self.request}, request_counter={self.request_counter}'
+        elif self.msg_type == NetControllerMsgType.RESPOND:
+            string += f', respond={self.respond}'
+        elif self.msg_type == NetControllerMsgType.RESERVE:
+            string += f', reservation={self.reservation}'
+        elif self.msg_type == NetControllerMsgType.RESERVE_RESULT:
+            string += f', reservation={self.reservation}, result={self.result}'
+        elif self.msg_type in (NetControllerMsgType.APPROVE, NetControllerMsgType.CANCEL):
+            string += f', reservation={self.reservation}, path={self.path}'
+        return string
     
 
 
+class TrafficEstimator:
+    '''Estimate the traffic matrix online from the served requests, with bounded memory.
+       Keeps an exponentially decayed counter per (src, dst), the counters are decayed lazily when updated or read.
+       When tracking capacity pairs, a new pair replaces the pair with the smallest decayed counter.
+       All the counters decay at the same rate, so their order doesn't change with time,
+       and the smallest one is kept by a heap of time-invariant scores with lazy deletion, i.e., O(log capacity) amortized per observation
+
+    Attributes:
+        half_life (int): the time (ps) for a counter to decay to half
+        capacity (int): the maximum number of (src, dst) pairs tracked
+        counters (dict): (src name, dst name) -> [counter, time of the last update]
+        heap (list): a heap of (score, order, pair), an entry is stale if it is not the pair's current (score, order)
+        heap_keys (dict): (src name, dst name) -> the current (score, order) of the pair
+        order (int): the counter of the tracked pairs, the tie breaker of the equal scores (the earlier tracked pair is replaced first)
+    '''
+    def __init__(self, half_life: int, capacity: int = 1000):
+        assert half_life > 0 and capacity > 0
+        self.half_life = half_life
+        self.capacity = capacity
+        self.counters = {}
+        self.heap = []
+        self.heap_keys = {}
+        self.order = 0
+
+    def __len__(self) -> int:
+        return len(self.counters)
+
+    def decay(self, counter: float, elapse: int) -> float:
+        '''return the counter after decaying for elapse (ps)
+        '''
+        return counter * 0.5 ** (elapse / self.half_life)
+
+    def get_counter(self, src: str, dst: str, time: int) -> float:
+        '''return the decayed counter of (src, dst) at time
+        '''
+        if (src, dst) not in self.counters:
+            return 0
+        counter, last_time = self.counters[(src, dst)]
+        return self.decay(counter, time - last_time)
+
+    def get_score(self, counter: float, time: int) -> float:
+        '''return the time-invariant score of a counter updated at time,
+           comparing the scores is the same as comparing the decayed counters at any time
+        '''
+        return math.log2(counter) + time / self.half_life
+
+    def observe(self, src: str, dst: str, time: int, weight: float = 1) -> None:
+        '''observe a served request from src to dst
+
+        Args:
+            src: the source node name
+            dst: the destination node name
+            time: the time of the observation (ps)
+            weight: the weight of the observation, positive
+        '''
+        pair = (src, dst)
+        if pair in self.heap_keys:
+            order = self.heap_keys[pair][1]
+        else:
+            if len(self.counters) >= self.capacity:
+                self.evict()
+            order = self.order
+            self.order += 1
+        counter = self.get_counter(src, dst, time) + weight
+        self.counters[pair] = [counter, time]
+        score = self.get_score(counter, time)
+        self.heap_keys[pair] = (score, order)
+        heappush(self.heap, (score, order, pair))
+        if len(self.heap) > 2 * self.capacity:  # drop the stale entries
+            self.heap = [(score, order, pair) for pair, (score, order) in self.heap_keys.items()]
+            heapify(self.heap)
+
+    def evict(self) -> None:
+        '''stop tracking the pair with the smallest decayed counter
+        '''
+        while self.heap:
+            score, order, pair = heappop(self.heap)
+            if self.heap_keys.get(pair) == (score, order):
+                del self.counters[pair]
+                del self.heap_keys[pair]
+                return
+
+    def get_flows(self, time: int) -> dict:
+        '''return the estimated traffic at time, (src name, dst name) -> probability, sorted by (src, dst)
+        '''
+        counters = {pair: self.get_counter(pair[0], pair[1], time) for pair in sorted(self.counters)}
+        summ = sum(counters.values())
+        if summ == 0:
+            return {}
+        return {pair: counter / summ for pair, counter in counters.items() if counter > 0}
+
+
 class NetworkController:
     '''The network controller at the centralized controller
+
+    Attributes:
+        owner (Controller): the centralized controller
+        request_counter (int): the number of requests sent to the workers
+        entanglement_routing_time (int): time for entanglement routing
+        traffic_estimator (TrafficEstimator): if not None, estimate the traffic from the served requests
+        request_source (RequestSource): sends the requests to the workers lazily, one at a time
+        centralized_reservation (bool): if True, the network controller reserves the path of a request itself,
+                                        by asking all the nodes on the path in parallel (instead of the hop-by-hop RSVP started by the src worker)
+        pending_reservations (dict): request counter -> [reservation, path, number of nodes not responded yet, whether all responded nodes succeeded]
     '''
     def __init__(self, owner: "Controller"):
         self.owner = owner
         self.request_counter = 0
         self.entanglement_routing_time = 0.01 * SECOND  # Time for entanglement routing
+        self.traffic_estimator: Optional[TrafficEstimator] = None
+        self.request_source = RequestSource(owner.timeline, self.send_request, self.get_send_time)
+        self.centralized_reservation = False
+        self.pending_reservations = {}
 
     
     def send_requests(self, requests: list[tuple]):
+        '''The requests are sent lazily: only the next request is scheduled, the one after it is scheduled when it is sent
+
+        Args:
+            requests (list[tuple]): each request in the list is a tuple: (src name, dst name, start time, end time, memory size, fidelity, entanglement number),
+                                    sorted by the start time
+        '''
+        # the request counters are assigned in the order of the list, not in the order of sending
+        self.request_source.add(zip(range(self.request_counter, self.request_counter + len(requests)), requests))
+        self.request_counter += len(requests)
+
+    def get_send_time(self, counter_request: tuple) -> int:
+        '''the time to send a request: entanglement_routing_time before the request starts
         '''
+        return counter_request[1][2] - self.entanglement_routing_time
+
+    def send_request(self, counter_request: tuple) -> None:
+        '''send a request to its src worker
+
+        Args:
+            counter_request (tuple): (request counter, request)
+        '''
+        request_counter, request = counter_request
+        if self.centralized_reservation:
+            self.reserve(request_counter, request)
+            return
+        worker = request[0]
+        msg = NetControllerMessage(NetControllerMsgType.REQUEST, receiver='application', request=request, request_counter=request_counter)
+        self.owner.send_message(worker, msg)
+
+    def reserve(self, request_counter: int, request: tuple) -> None:
+        '''centralized path reservation: send RESERVE to every node on the static shortest path at the same time.
+           The setup latency is two round trips between the controller and the nodes, regardless of the path length
+
         Args:
-            requests (list[tuple]): each request in the list is a tuple: (src name, dst name, start time, end time, memory size, fidelity, entanglement number)
+            request_counter (int): the request counter, becomes the identity of the reservation
+            request (tuple): (src name, dst name, start time, end time, memory size, fidelity, entanglement number)
+        '''
+        src, dst, start_time, end_time, memory_size, fidelity, entanglement_number = request
+        path = self.owner.adaptive_continuous.get_shortest_path(src, dst)
+        if path is None:
+            log.logger.warning('%s no path from %s to %s, request %s dropped', self.owner.name, src, dst, request_counter)
+            return
+        reservation = Reservation(src, dst, start_time, end_time, memory_size, fidelity, entanglement_number, request_counter)
+        self.pending_reservations[request_counter] = [reservation, path, len(path), True]
+        for node in path:
+            msg = NetControllerMessage(NetControllerMsgType.RESERVE, receiver='resource_reservation', reservation=reservation)
+            self.owner.send_message(node, msg)
+
+    def received_reserve_result(self, msg: NetControllerMessage) -> None:
+        '''centralized path reservation: after all the nodes on the path respond,
+           send APPROVE to all of them if all succeeded, else send CANCEL to all of them
         '''
-        # use the sequence events to send the message
-        for request in requests:
-            worker = request[0]
-            time = request[2] - self.entanglement_routing_time
-            msg = NetControllerMessage(NetControllerMsgType.REQUEST, receiver='application', request=request, request_counter=self.request_counter)
-            process = Process(self.owner, 'send_message', [worker, msg])
-            event = Event(time, process)
-            self.owner.timeline.schedule(event)
-            self.request_counter += 1
+        pending = self.pending_reservations[msg.reservation.identity]
+        pending[2] -= 1
+        pending[3] = pending[3] and msg.result
+        if pending[2] > 0:
+            return
+        reservation, path, _, success = self.pending_reservations.pop(msg.reservation.identity)
+        if success:
+            reservation.set_path(path)
+            msg_type = NetControllerMsgType.APPROVE
+        else:
+            log.logger.info('%s centralized reservation failed: %s', self.owner.name, reservation)
+            msg_type = NetControllerMsgType.CANCEL
+        for node in path:
+            msg = NetControllerMessage(msg_type, receiver='resource_reservation', reservation=reservation, path=path)
+            self.owner.send_message(node, msg)
 
     def received_message(self, src: str, msg: NetControllerMessage):
         '''Received classical message from the workers
         '''
-        log.logger.debug(f'{self.owner.name} receive message from {src}: {msg}')
-         # TODO
+        log.logger.debug('%s receive message from %s: %s', self.owner.name, src, msg)
+        if msg.msg_type is NetControllerMsgType.RESERVE_RESULT:
+            self.received_reserve_result(msg)
+        elif msg.msg_type is NetControllerMsgType.RESPOND:
+            if msg.respond and msg.reservation is not None and self.traffic_estimator is not None:
+                reservation = msg.reservation
+                self.traffic_estimator.observe(reservation.initiator, reservation.responder, self.owner.timeline.now())
@@ -67,7 +67,7 @@ class QuantumRouterAdaptiveWorker(QuantumRouter):
             src (str): name of node that sends the message
             msg (Message): the message
         """
-        log.logger.info("{} receive message {} from {}".format(self.name, msg, src))
+        log.logger.info('%s receive message %s from %s', self.name, msg, src)
         if msg.receiver == "network_manager":
             self.network_manager.received_message(src, msg)
         elif msg.receiver == "resource_manager":
@@ -76,6 +76,8 @@ class QuantumRouterAdaptiveWorker(QuantumRouter):
             self.adaptive_continuous.received_message(src, msg)
         elif msg.receiver == "application":
             self.app.received_message(src, msg)
+        elif msg.receiver == "resource_reservation":  # the centralized path reservation from the network controller
+            self.network_manager.protocol_stack[-1].received_message(src, msg)
         else:
             if msg.receiver is None:  # the msg sent by EntanglementGenerationB doesn't have a receiver (A-B not paired)
                 matching = [p for p in self.protocols if type(p) == msg.protocol_type]
@@ -156,7 +158,7 @@ class QuantumRouterAdaptive(QuantumRouter):
             src (str): name of node that sends the message
             msg (Message): the message
         """
-        log.logger.info("{} receive message {} from {}".format(self.name, msg, src))
+        log.logger.info('%s receive message %s from %s', self.name, msg, src)
         if msg.receiver == "network_manager":
             self.network_manager.received_message(src, msg)
         elif msg.receiver == "resource_manager":
@@ -4,6 +4,8 @@
 import numpy as np
 from typing import TYPE_CHECKING
 from sequence.app.request_app import RequestApp
+from sequence.kernel.event import Event
+from sequence.kernel.process import Process
 import sequence.utils.log as log
 from collections import defaultdict
 from reservation import ReservationAdaptive
@@ -119,7 +121,7 @@ class RequestAppThroughput(RequestApp):
         '''
         timestamp = self.node.timeline.now()
         cache = self.node.adaptive_continuous.cache
-        cache.append((timestamp, path))
+        cache.add(timestamp, path)
         log.logger.debug(f'{self.node.name} added {(timestamp, path)} to cache')
 
 
@@ -224,7 +226,7 @@ class RequestAppTimeToServe(RequestApp):
                     respond = False
                 
                 # send message to the centralized controller
-                msg = NetControllerMessage(NetControllerMsgType.RESPOND, 'network_controller', respond=respond)
+                msg = NetControllerMessage(NetControllerMsgType.RESPOND, 'network_controller', respond=respond, reservation=reservation)
                 self.node.send_message('Controller', msg)
 
             elif info.remote_node == reservation.responder:
@@ -271,7 +273,7 @@ class RequestAppTimeToServe(RequestApp):
         '''
         timestamp = self.node.timeline.now()
         cache = self.node.adaptive_continuous.cache
-        cache.append((timestamp, path))
+        cache.add(timestamp, path)
         log.logger.debug(f'{self.node.name} added {(timestamp, path)} to cache')
 
 
@@ -313,3 +315,181 @@ class RequestAppTimeToServe(RequestApp):
             time_elapse = (reservation.end_time - reservation.start_time) / SECOND
             request_to_throughput[reservation] = len(entanglement_timestamps) / time_elapse
         return request_to_throughput
+
+
+class RequestAppConcurrent(RequestAppTimeToServe):
+    '''for the time-to-serve and throughput metrics under concurrent requests
+
+    Handles many overlapping requests (for a node) at the same time.
+    A request is keyed by (initiator name, request id), i.e. (reservation.initiator, reservation.identity),
+    because two reservations with the same initiator, responder, start/end time, memory size and fidelity are equal (and hash the same).
+
+    Attributes:
+        requests (dict): request id -> (responder, start time, end time, memory size, fidelity, entanglement number), the requests this node initiated
+        reservations (dict): (initiator, request id) -> the approved reservation, both the initiated ones and the responded ones
+        rejected (set): the request ids (initiated by this node) that the network rejected
+        entanglement_counter (dict): (initiator, request id) -> the number of entanglement pairs delivered so far
+        served_time (dict): (initiator, request id) -> the time (ps) when the request is served, i.e. delivered all its entanglement pairs
+    '''
+
+    def __init__(self, node: "QuantumRouterAdaptive"):
+        super().__init__(node)
+        self.requests = {}
+        self.reservations = {}
+        self.rejected = set()
+        self.entanglement_counter = defaultdict(int)
+        self.served_time = {}
+
+    @staticmethod
+    def get_key(reservation: "Reservation") -> tuple:
+        '''the key of the request that generates the reservation
+        '''
+        return (reservation.initiator, reservation.identity)
+
+    def start(self, responder: str, start_t: int, end_t: int, memo_size: int, fidelity: float, entanglement_number: int = 1, id: int = 0):
+        """Method to start a request. Does not overwrite the other requests of this app
+
+        Args:
+            responder: the name of the responder node
+            start_t: the start time (ps) of the request
+            end_t: the end time (ps) of the request
+            memo_size: the number of memories for the request
+            fidelity: the target fidelity
+            entanglement_number: the number of entanglement pairs the request ask for
+            id: the request id, should be unique among the requests of this node
+        """
+        assert 0 < fidelity <= 1
+        assert 0 <= start_t <= end_t
+        assert 0 < memo_size
+        assert id not in self.requests, f'{self.node.name} request id={id} already exists'
+        self.requests[id] = (responder, start_t, end_t, memo_size, fidelity, entanglement_number)
+        self.node.reserve_net_resource(responder, start_t, end_t, memo_size, fidelity, entanglement_number, id)
+
+    def get_reservation_result(self, reservation: "Reservation", result: bool) -> None:
+        """override RequestApp.get_reservation_result(), the initiator calls this method once received a response from the responder
+
+        Args:
+            reservation: the reservation of the request
+            result: approved or rejected
+        """
+        # with the centralized path reservation, the request does not go through start()
+        self.requests.setdefault(reservation.identity, (reservation.responder, reservation.start_time, reservation.end_time,
+                                                        reservation.memory_size, reservation.fidelity, reservation.entanglement_number))
+        if result:
+            self.reservations[self.get_key(reservation)] = reservation
+            self.schedule_reservation(reservation)
+            log.logger.info('%s reservation approved: %s', self.name, reservation)
+        else:
+            self.rejected.add(reservation.identity)
+            log.logger.info('%s reservation rejected: %s', self.name, reservation)
+
+    def get_other_reservation(self, reservation: "Reservation") -> None:
+        """override RequestApp.get_other_reservation(), the responder calls this method
+
+        Args:
+            reservation: the reservation that uses this node as the responder
+        """
+        self.reservations[self.get_key(reservation)] = reservation
+        self.schedule_reservation(reservation)
+
+    def schedule_reservation(self, reservation: "Reservation") -> None:
+        """override RequestApp.schedule_reservation(), map the reservation's memories during [start time, end time).
+           Matches the timecards by object identity, because equal reservations of different requests may co-exist
+        """
+        reservation_protocol = self.node.network_manager.protocol_stack[1]
+        for card in reservation_protocol.timecards:
+            if any(r is reservation for r in card.reservations):
+                process = Process(self, 'add_memo_reservation_map', [card.memory_index, reservation])
+                event = Event(reservation.start_time, process)
+                self.node.timeline.schedule(event)
+                process = Process(self, 'remove_memo_reservation_map', [card.memory_index, reservation])
+                event = Event(reservation.end_time, process)
+                self.node.timeline.schedule(event)
+
+    def remove_memo_reservation_map(self, index: int, reservation: "Reservation" = None) -> None:
+        """override RequestApp.remove_memo_reservation_map(), only remove the mapping if the memory still maps to the reservation,
+           because the next reservation of the memory may start at the same time as this reservation ends
+
+        Args:
+            index: the memory index
+            reservation: the reservation that ends
+        """
+        if reservation is None or self.memo_to_reservation.get(index) is reservation:
+            self.memo_to_reservation.pop(index, None)
+
+    def get_memory(self, info: "MemoryInfo") -> None:
+        """override RequestAppTimeToServe.get_memory(), count the entanglement pairs per request
+
+        Args:
+            info (MemoryInfo): info on the qualified entangled memory.
+        """
+        if info.state != MemoryInfo.ENTANGLED:
+            return
+
+        reservation = self.memo_to_reservation.get(info.index)
+        if reservation is None:
+            return
+        key = self.get_key(reservation)
+        if info.remote_node == reservation.initiator:    # the responder
+            respond = info.fidelity >= reservation.fidelity
+            if respond:
+                self.record_entanglement(reservation, info)
+                if self.entanglement_counter[key] == reservation.entanglement_number:
+                    self.served_time[key] = self.node.timeline.now()
+                    self.node.resource_manager.expire_rules_by_reservation(reservation)
+            else:
+                log.logger.info('Memory=%s, does not meet the fidelity threshold, %s', info, reservation)
+            # send message to the centralized controller
+            msg = NetControllerMessage(NetControllerMsgType.RESPOND, 'network_controller', respond=respond, reservation=reservation)
+            self.node.send_message('Controller', msg)
+
+        elif info.remote_node == reservation.responder:  # the initiator
+            if info.fidelity >= reservation.fidelity:
+                self.record_entanglement(reservation, info)
+                log.logger.info('Successfully generated entanglement. %s: %s, %.6f', reservation, self.entanglement_counter[key], info.fidelity)
+                if self.entanglement_counter[key] == reservation.entanglement_number:
+                    self.served_time[key] = self.node.timeline.now()
+                    self.time_to_serve[reservation] = self.node.timeline.now() - reservation.start_time
+                    self.node.resource_manager.expire_rules_by_reservation(reservation)
+                    self.send_expire_rules_message(reservation)
+            else:
+                log.logger.info('Memory=%s has not meet the threshold, %s', info, reservation)
+
+    def record_entanglement(self, reservation: "Reservation", info: "MemoryInfo") -> None:
+        '''record a delivered entanglement pair for the reservation, and release the memory
+        '''
+        self.entanglement_counter[self.get_key(reservation)] += 1
+        self.entanglement_timestamps[reservation].append(self.node.timeline.now())
+        self.entanglement_fidelities[reservation].append(info.fidelity)
+        self.node.resource_manager.update(None, info.memory, MemoryInfo.RAW)
+
+    def get_request_results(self) -> dict:
+        '''the result of each request initiated by this node
+
+        Return:
+            dict: request id -> (status, number of entanglement pairs delivered, time to serve (ps) or None),
+                  status is one of 'pending', 'rejected', 'approved', 'served'
+        '''
+        results = {}
+        for id, request in self.requests.items():
+            key = (self.node.name, id)
+            if id in self.rejected:
+                results[id] = ('rejected', 0, None)
+            elif key in self.served_time:
+                results[id] = ('served', self.entanglement_counter[key], self.served_time[key] - request[1])
+            elif key in self.reservations:
+                results[id] = ('approved', self.entanglement_counter[key], None)
+            else:
+                results[id] = ('pending', 0, None)
+        return results
+
+    def get_request_to_throughput(self) -> dict:
+        '''override, the throughput of each request initiated by this node, keyed by request id
+        Return:
+            Dict[int, float]
+        '''
+        request_to_throughput = {}
+        for id, request in self.requests.items():
+            time_elapse = (request[2] - request[1]) / SECOND
+            request_to_throughput[id] = self.entanglement_counter[(self.node.name, id)] / time_elapse
+        return request_to_throughput
@@ -0,0 +1,95 @@
+'''Inject the requests into the timeline lazily, one at a time, instead of scheduling all of them upfront
+'''
+
+from heapq import heappush, heappop
+from typing import TYPE_CHECKING, Callable, Iterable
+
+from sequence.kernel.process import Process
+from sequence.kernel.event import Event
+
+if TYPE_CHECKING:
+    from sequence.kernel.timeline import Timeline
+
+
+class RequestSource:
+    '''Holds only the next request of each request stream, and keeps only one event in the timeline per distinct injection time.
+       When the next request is injected, the request after it is pulled from its stream and scheduled.
+       So the timeline's event heap grows with the number of active requests, not with the total number of requests.
+
+       The requests within one stream must be sorted by their injection time, otherwise a ValueError is raised when the stream is pulled.
+       Requests injected at the same time are injected in the order of the streams, then in the order within a stream.
+
+       Usage: source = RequestSource(timeline, inject, get_time); source.add(requests)
+
+    Attributes:
+        timeline (Timeline): the simulation timeline
+        inject (Callable): called with a request when the request is due
+        get_time (Callable): request -> the injection time (ps) of the request
+        heads (list): a heap of (injection time, stream order, request, stream), holds the next request of each stream
+        scheduled_times (set): the times that already have an inject event in the timeline
+        order (int): the stream counter, also the tie breaker of the requests injected at the same time
+        injected (int): the number of requests injected so far
+    '''
+    def __init__(self, timeline: "Timeline", inject: Callable, get_time: Callable):
+        self.timeline = timeline
+        self.inject = inject
+        self.get_time = get_time
+        self.heads = []
+        self.scheduled_times = set()
+        self.order = 0
+        self.injected = 0
+
+    def __len__(self) -> int:
+        return len(self.heads)
+
+    def add(self, requests: Iterable) -> None:
+        '''add a stream of requests
+
+        Args:
+            requests: an iterable (e.g. a generator) of requests, sorted by injection time,
+                      a request whose injection time is in the past is injected now
+        '''
+        stream = iter(requests)
+        order = self.order
+        self.order += 1
+        self.pull(stream, order)
+
+    def pull(self, stream, order: int, previous_time: int = None) -> None:
+        '''pull the next request from a stream and make sure it will be injected
+
+        Args:
+            stream: the iterator of the requests
+            order: the order of the stream
+            previous_time: the injection time (ps) of the previous request in the stream, None if it is the first request
+        '''
+        request = next(stream, None)
+        if request is None:
+            return
+        request_time = self.get_time(request)
+        if previous_time is not None and request_time < previous_time:
+            raise ValueError(f'stream {order} is not sorted by the injection time: request {request} at {request_time} ps comes after a request at {previous_time} ps')
+        time = max(request_time, self.timeline.now())
+        heappush(self.heads, (time, order, request, stream))
+        self.schedule_inject(time)
+
+    def schedule_inject(self, time: int) -> None:
+        '''make sure there is an inject event at time
+        '''
+        if time not in self.scheduled_times:
+            self.scheduled_times.add(time)
+            process = Process(self, 'fire', [time])
+            event = Event(time, process)
+            self.timeline.schedule(event)
+
+    def fire(self, time: int) -> None:
+        '''inject all the requests due at time
+
+        Args:
+            time: the time of this inject event
+        '''
+        self.scheduled_times.discard(time)
+        while self.heads and self.heads[0][0] <= time:
+            _, order, request, stream = heappop(self.heads)
+            self.inject(request)
+            self.injected += 1
+            self.pull(stream, order, self.get_time(request))
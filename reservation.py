@@ -15,6 +15,7 @@ from generation import EntanglementGenerationAadaptive, ShEntanglementGeneration
 from swapping import EntanglementSwappingA_bds, EntanglementSwappingB_bds
 from sequence.entanglement_management.swapping import EntanglementSwappingA, EntanglementSwappingB
 from purification import BBPSSW_bds
+from network_controller import NetControllerMsgType, NetControllerMessage
 from sequence.entanglement_management.purification import BBPSSW
 
 if TYPE_CHECKING:
@@ -323,19 +324,32 @@ class ResourceReservationProtocolAdaptive(ResourceReservationProtocol):
             self.owner.timeline.schedule(event)
 
             process = Process(self.owner.resource_manager, "expire", [rule])
-            event = Event(reservation.end_time, process, self.owner.timeline.schedule_counter)
-            self.owner.timeline.schedule(event)
+            self.schedule_expire(process, reservation.end_time)
 
 
         for card in self.timecards:
             if reservation in card.reservations:
                 process = Process(self.owner.resource_manager, "update", [None, self.memo_arr[card.memory_index], "RAW"]) # update memory to RAW
-                event = Event(reservation.end_time, process, self.owner.timeline.schedule_counter)
-                self.owner.timeline.schedule(event)
+                self.schedule_expire(process, reservation.end_time)
+
+                process = Process(self.owner.adaptive_continuous, "adaptive_memory_used_minus_one", [self.memo_arr[card.memory_index], reservation])
+                self.schedule_expire(process, reservation.end_time)
+
+
+    def schedule_expire(self, process: Process, end_time: int) -> None:
+        """schedule a process at the end of an AC protocol reservation.
+           The AC protocol's reservations end at a multiple of its period, so the processes of all the nodes share the ticker if there is one
 
-                process = Process(self.owner.adaptive_continuous, "adaptive_memory_used_minus_one", [self.memo_arr[card.memory_index]])
-                event = Event(reservation.end_time, process, self.owner.timeline.schedule_counter)
-                self.owner.timeline.schedule(event)
+        Args:
+            process: the process
+            end_time: the end time of the reservation
+        """
+        ticker = self.owner.adaptive_continuous.ticker
+        if ticker is not None:
+            ticker.register(process, end_time, priority=self.owner.timeline.schedule_counter)
+        else:
+            event = Event(end_time, process, self.owner.timeline.schedule_counter)
+            self.owner.timeline.schedule(event)
 
 
     def create_rules_request(self, path: list, reservation: ReservationAdaptive) -> List["Rule"]:
@@ -504,6 +518,36 @@ class ResourceReservationProtocolAdaptive(ResourceReservationProtocol):
         else:
             raise Exception("Unknown type of message", msg.msg_type)
 
+    def received_message(self, src: str, msg: NetControllerMessage):
+        """override ResourceReservationProtocol.received_message(), receive the centralized path reservation messages from the network controller
+
+        1. RESERVE: schedule the reservation on the timecards, and respond the result to the network controller.
+        2. APPROVE: all nodes on the path are scheduled, create and load the rules. The initiator and responder inform the application.
+        3. CANCEL: some node on the path failed to schedule, release the timecards. The initiator informs the application.
+
+        Args:
+            src (str): the network controller.
+            msg (NetControllerMessage): message received.
+        """
+        reservation = msg.reservation
+        if msg.msg_type is NetControllerMsgType.RESERVE:
+            assert self.owner.timeline.now() < reservation.start_time
+            result = self.schedule(reservation)
+            new_msg = NetControllerMessage(NetControllerMsgType.RESERVE_RESULT, 'network_controller', reservation=reservation, result=result)
+            self.owner.send_message(src, new_msg)
+        elif msg.msg_type is NetControllerMsgType.APPROVE:
+            rules = self.create_rules_request(msg.path, reservation)
+            self.load_rules(rules, reservation)
+            if self.owner.name in (reservation.initiator, reservation.responder):
+                self._pop(msg=ResourceReservationMessage(RSVPMsgType.APPROVE, self.name, reservation, path=msg.path))
+        elif msg.msg_type is NetControllerMsgType.CANCEL:
+            for card in self.timecards:
+                card.remove(reservation)
+            if self.owner.name == reservation.initiator:
+                self._pop(msg=ResourceReservationMessage(RSVPMsgType.REJECT, self.name, reservation, path=msg.path))
+        else:
+            raise Exception("Unknown type of message", msg.msg_type)
+
     def next_hop_when_tracing_back(self, path: List[str]) -> str:
         '''the next hop when going back from the responder to the initiator
 
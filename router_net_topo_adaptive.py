@@ -1,24 +1,59 @@
 '''Generate quantum network with quantum routers customized for the adaptive-continuous protocol
 '''
 
+import hashlib
 import json
-from networkx import Graph, single_source_dijkstra, exception
+import os
+import pickle
+from networkx import Graph, single_source_dijkstra
 from sequence.topology.topology import Topology as Topo
 from sequence.topology.router_net_topo import RouterNetTopo
+from sequence.topology.node import Node
 from sequence.kernel.timeline import Timeline
 from sequence.kernel.quantum_manager import BELL_DIAGONAL_STATE_FORMALISM
+from sequence.components.optical_channel import ClassicalChannel
 from sequence.constants import SPEED_OF_LIGHT, MICROSECOND
 
 from node import QuantumRouterAdaptiveWorker, BSMNodeAdaptive
 from controller import Controller
+from ticker import Ticker
+
+
+class LazyClassicalChannels(dict):
+    '''The classical channels of a node, receiver name -> ClassicalChannel.
+       A channel is created by the topology the first time the node uses it, e.g., node.cchannels[dst] in Node.send_message()
+    '''
+    def __init__(self, topology: "RouterNetTopoAdaptive", node: Node, cchannels: dict):
+        super().__init__(cchannels)
+        self.topology = topology
+        self.node = node
+
+    def __missing__(self, receiver: str) -> ClassicalChannel:
+        return self.topology.create_cchannel(self.node, receiver)  # set_ends() adds the channel to this dict
 
 
 class RouterNetTopoAdaptive(RouterNetTopo):
     '''Class for generating quantum network with quantum routers customized for the adaptive-continuous protocol
     '''
 
-    def __init__(self, conf_file_name: str):
+    ALL_PAIRS_C_CHANNEL = 'all_pairs_cchannels'  # the compact directive of the classical channels, {"distance": float, "delay": float}
+    ROUTING_CACHE_VERSION = 1  # bump when the routing or the classical delay model changes, so that the old caches are not used
+
+    def __init__(self, conf_file_name: str, cache_directory: str = None, lazy_cchannels: bool = False):
+        '''
+        Args:
+            conf_file_name: the config file
+            cache_directory: if not None, cache the routing artifacts (graph, forwarding tables, classical delays) in this directory,
+                             keyed by the hash of the config
+            lazy_cchannels: if True, a classical channel in the config is created the first time its sender uses it
+        '''
         self.graph = None   # the graph of the network
+        self.ticker = None  # the ticker shared by the nodes in the network
+        self.cache_directory = cache_directory
+        self.lazy_cchannels = lazy_cchannels
+        self.cchannel_specs = {}  # (sender name, receiver name) -> [channel name, distance, delay], for the lazy classical channels
+        self.link_distances = {}  # frozenset of two router names -> distance, the quantum links in the config
+        self.routing_trees = {}   # source router name -> (lengths, paths), the shortest path trees of the forwarding tables
         super().__init__(conf_file_name)
 
     def _load(self, filename: str):
@@ -40,6 +75,7 @@ class RouterNetTopoAdaptive(RouterNetTopo):
         self._add_cconnections(config)
         self._generate_forwarding_table(config)
         self._inform_controller_topology()
+        self._add_ticker()
 
 
     def _add_nodes(self, config: dict):
@@ -79,14 +115,136 @@ class RouterNetTopoAdaptive(RouterNetTopo):
             self.tl.set_quantum_manager(BELL_DIAGONAL_STATE_FORMALISM)
 
 
+    def _add_cchannels(self, config: dict):
+        """overrides Topology._add_cchannels()
+           Besides the explicit "cchannels", expand the "all_pairs_cchannels" directive into the classical channels between
+           1) each BSM node and its quantum routers, 2) every ordered pair of quantum routers, 3) the controller and every quantum router.
+           A channel given explicitly is not duplicated.
+           The delays of the channels between routers and BSM nodes are set by the delay model in _generate_forwarding_table(),
+           so effectively the directive's distance only matters for the controller's channels.
+           If lazy_cchannels, only the specifications are kept, a channel is created when its sender first uses it
+
+        Args:
+            config (dict): the config file
+        """
+        specs = self._get_cchannel_specs(config)
+        if self.lazy_cchannels:
+            self.cchannel_specs = {(src, dst): [name, distance, delay] for src, dst, name, distance, delay in specs}
+            for nodes in self.nodes.values():
+                for node in nodes:
+                    node.cchannels = LazyClassicalChannels(self, node, node.cchannels)
+        else:
+            for src, dst, name, distance, delay in specs:
+                cc = ClassicalChannel(name, self.tl, distance, delay)
+                cc.set_ends(self.tl.get_entity_by_name(src), dst)
+                self.cchannels.append(cc)
+
+    def _get_cchannel_specs(self, config: dict) -> list:
+        """the classical channels in the config, explicit ones first, then the ones expanded from the directive
+
+        Args:
+            config (dict): the config file
+        Return:
+            list: a list of (sender name, receiver name, channel name, distance, delay)
+        """
+        specs = []
+        for cc in config.get(self.ALL_C_CHANNEL, []):
+            src, dst = cc[self.SRC], cc[self.DST]
+            if self.tl.get_entity_by_name(src) is not None:
+                specs.append((src, dst, cc.get(self.NAME, f'cc.{src}.{dst}'), cc.get(self.DISTANCE, 1000), cc.get(self.DELAY, -1)))
+
+        directive = config.get(self.ALL_PAIRS_C_CHANNEL)
+        if directive is None:
+            return specs
+
+        distance = directive.get(self.DISTANCE, 1000)
+        delay = directive.get(self.DELAY, -1)
+        pairs = []
+        for bsm, routers in self.bsm_to_router_map.items():
+            pairs.extend((router, bsm) for router in routers)
+            pairs.extend((bsm, router) for router in routers)
+        router_names = [router.name for router in self.nodes[self.QUANTUM_ROUTER]]
+        for i, router1 in enumerate(router_names):
+            for router2 in router_names[i+1:]:
+                pairs.append((router1, router2))
+                pairs.append((router2, router1))
+        for controller in self.nodes[self.CONTROLLER]:
+            for router in router_names:
+                pairs.append((controller.name, router))
+                pairs.append((router, controller.name))
+
+        existing = {(src, dst) for src, dst, _, _, _ in specs}
+        for src, dst in pairs:
+            if (src, dst) not in existing and self.tl.get_entity_by_name(src) is not None:
+                specs.append((src, dst, f'cc.{src}.{dst}', distance, delay))
+        return specs
+
+    def create_cchannel(self, sender: Node, receiver: str) -> ClassicalChannel:
+        """create a classical channel from its specification, used by the lazy classical channels
+
+        Args:
+            sender: the sender node
+            receiver: the name of the receiver node
+        Return:
+            the classical channel
+        """
+        spec = self.cchannel_specs.get((sender.name, receiver))
+        if spec is None:
+            raise KeyError(receiver)
+        name, distance, delay = spec
+        cc = ClassicalChannel(name, self.tl, distance, delay)
+        cc.set_ends(sender, receiver)
+        self.cchannels.append(cc)
+        return cc
+
+    def _get_cchannel_ends(self) -> list:
+        """the (sender name, receiver name, distance) of the classical channels, created or not (lazy)
+        """
+        ends = [(cc.sender.name, cc.receiver, cc.distance) for cc in self.cchannels]
+        if self.lazy_cchannels:
+            created = {(src, dst) for src, dst, _ in ends}
+            ends.extend((src, dst, spec[1]) for (src, dst), spec in self.cchannel_specs.items() if (src, dst) not in created)
+        return ends
+
     def _generate_forwarding_table(self, config: dict):
         """For static routing.
-           Also updating the classical communication delay
+           Also updating the classical communication delay.
+           If cache_directory is set, the routing artifacts are loaded from the cache when the same config was seen before
 
         Args:
             config (dict): the config file
         """
+        cache_filename = None
+        if self.cache_directory is not None:
+            config_hash = hashlib.sha256(json.dumps([self.ROUTING_CACHE_VERSION, config], sort_keys=True).encode()).hexdigest()
+            cache_filename = os.path.join(self.cache_directory, f'{config_hash}.pickle')
+            if os.path.exists(cache_filename):
+                with open(cache_filename, 'rb') as fh:
+                    artifacts = pickle.load(fh)
+                self._apply_routing_artifacts(artifacts)
+                return
 
+        artifacts = self._compute_routing_artifacts(config)
+        self._apply_routing_artifacts(artifacts)
+
+        if cache_filename is not None:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            tmp_filename = f'{cache_filename}.{os.getpid()}.tmp'
+            with open(tmp_filename, 'wb') as fh:
+                pickle.dump(artifacts, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_filename, cache_filename)  # atomic, in case several runs write the same cache
+
+    def _compute_routing_artifacts(self, config: dict) -> dict:
+        """compute the graph, the forwarding tables and the classical delays from the config
+
+        Args:
+            config (dict): the config file
+        Return:
+            dict: 'nodes' -> the router names of the graph,
+                  'edges' -> [(router, router, distance)],
+                  'next_hops' -> {router name -> {dst name -> next hop}},
+                  'cchannels' -> {(sender name, receiver name) -> (delay, distance)}
+        """
         all_paths = {}  # (src, dst) -> (length: float, hop: int, path: tuple), only quantum channels
 
         graph = Graph()
@@ -116,49 +274,190 @@ class RouterNetTopoAdaptive(RouterNetTopo):
                     costs[bsm] = [router] + costs[bsm]
                     costs[bsm][-1] += qc.distance
 
-        graph.add_weighted_edges_from(costs.values())
-        self.graph = graph
+        edges = [tuple(cost) for cost in costs.values()]  # keep the insertion order, which affects the tie-breaking of the shortest paths
+        graph.add_weighted_edges_from(edges)
 
+        # one shortest path tree per source. For a pair, the path is computed from the node with the smaller name (tie-breaking),
+        # single_source_dijkstra() to all targets gives the same path to a target as single_source_dijkstra() to that target only
+        trees = {}  # source name -> (lengths, paths)
+        next_hops = {}
         for src in self.nodes[self.QUANTUM_ROUTER]:
+            next_hops[src.name] = {}
             for dst_name in graph.nodes:
                 if src.name == dst_name:
                     continue
-                try:
-                    if dst_name > src.name:
-                        length, path = single_source_dijkstra(graph, src.name, dst_name)
-                    else:
-                        length, path = single_source_dijkstra(graph, dst_name, src.name)
-                        path = path[::-1]
-                    # update all_paths
-                    hop_count = len(path) - 2
-                    all_paths[(src.name, dst_name)] = (length, hop_count, tuple(path))
-                    
-                    next_hop = path[1]
-                    # routing protocol locates at the bottom of the stack
-                    routing_protocol = src.network_manager.protocol_stack[0]  # guarantee that [0] is the routing protocol
-                    routing_protocol.add_forwarding_rule(dst_name, next_hop)
-                except exception.NetworkXNoPath:
-                    pass
+                source, target = (src.name, dst_name) if dst_name > src.name else (dst_name, src.name)
+                if source not in trees:
+                    trees[source] = single_source_dijkstra(graph, source)
+                lengths, paths = trees[source]
+                if target not in paths:  # no path
+                    continue
+                length, path = lengths[target], paths[target]
+                if source != src.name:
+                    path = path[::-1]
+                # update all_paths
+                hop_count = len(path) - 2
+                all_paths[(src.name, dst_name)] = (length, hop_count, tuple(path))
+                next_hops[src.name][dst_name] = path[1]
         
-        # update the classical delay and the distance
-        def classical_delay(distance: float, hop_count: int) -> float:
-            """Model the classical delay as a function of distance and hop count
-            """
-            return distance / SPEED_OF_LIGHT + hop_count * 20 * MICROSECOND + 100 * MICROSECOND
+        self.routing_trees = trees  # kept for the incremental updates when a link is removed or added
 
-        for cc in self.cchannels:
-            src = cc.sender.name
-            dst = cc.receiver
+        # update the classical delay and the distance
+        classical_delay = self.classical_delay
+        cchannels = {}
+        for src, dst, distance in self._get_cchannel_ends():
             if (src, dst) in all_paths: # BSM - quantum router, quantum router - quantum router
                 length, hop_count, path = all_paths[(src, dst)]
-                cc.delay = classical_delay(length, hop_count)
-                cc.distance = length   # not important
+                cchannels[(src, dst)] = (classical_delay(length, hop_count), length)   # the distance is not important
             else:  # controller - quantum_router
-                length = cc.distance
+                length = distance
                 hop_count = 0
-                cc.delay = classical_delay(length, hop_count)
+                cchannels[(src, dst)] = (classical_delay(length, hop_count), length)
             # print(f'{path}: {cc.delay/1e6}us')
 
+        return {'nodes': list(graph.nodes), 'edges': edges, 'next_hops': next_hops, 'cchannels': cchannels}
+
+    @staticmethod
+    def classical_delay(distance: float, hop_count: int) -> float:
+        """Model the classical delay as a function of distance and hop count
+        """
+        return distance / SPEED_OF_LIGHT + hop_count * 20 * MICROSECOND + 100 * MICROSECOND
+
+    def _apply_routing_artifacts(self, artifacts: dict):
+        """set the graph, the forwarding tables and the classical delays
+
+        Args:
+            artifacts (dict): returned by _compute_routing_artifacts()
+        """
+        graph = Graph()
+        graph.add_nodes_from(artifacts['nodes'])
+        graph.add_weighted_edges_from(artifacts['edges'])
+        self.graph = graph
+        self.link_distances = {frozenset((router1, router2)): distance for router1, router2, distance in artifacts['edges']}
+
+        for src in self.nodes[self.QUANTUM_ROUTER]:
+            routing_protocol = src.network_manager.protocol_stack[0]  # guarantee that [0] is the routing protocol
+            for dst_name, next_hop in artifacts['next_hops'][src.name].items():
+                routing_protocol.add_forwarding_rule(dst_name, next_hop)
+
+        cchannels = artifacts['cchannels']
+        for cc in self.cchannels:
+            cc.delay, cc.distance = cchannels[(cc.sender.name, cc.receiver)]
+        if self.lazy_cchannels:
+            for (src, dst), spec in self.cchannel_specs.items():
+                spec[2], spec[1] = cchannels[(src, dst)]
+
+    def remove_quantum_link(self, router1: str, router2: str) -> list:
+        """Remove the quantum link between two routers in the middle of the simulation, e.g., a link failure.
+           The BSM node and the channels stay, but the routing and the adaptive continuous protocol no longer use the link.
+           Only the shortest path trees that use the link are recomputed
+
+        Args:
+            router1: the name of a router
+            router2: the name of the other router
+        Return:
+            list: the names of the routers whose forwarding table changed
+        """
+        if not self.graph.has_edge(router1, router2):
+            raise ValueError(f'no quantum link between {router1} and {router2}')
+        affected = []
+        for source in self._get_tree_sources():
+            _, paths = self._get_routing_tree(source)
+            path1, path2 = paths.get(router1, []), paths.get(router2, [])
+            # the tree uses the link if one end is the parent of the other end
+            if path2[-2:-1] == [router1] or path1[-2:-1] == [router2]:
+                affected.append(source)
+        self.graph.remove_edge(router1, router2)
+        return self._update_routing(affected)
+
+    def add_quantum_link(self, router1: str, router2: str) -> list:
+        """Add (back) the quantum link between two routers in the middle of the simulation, e.g., a link recovery.
+           The link must be in the config, i.e., the two routers share a BSM node.
+           Only the shortest path trees that the link may shorten are recomputed
+
+        Args:
+            router1: the name of a router
+            router2: the name of the other router
+        Return:
+            list: the names of the routers whose forwarding table changed
+        """
+        distance = self.link_distances.get(frozenset((router1, router2)))
+        if distance is None:
+            raise ValueError(f'no BSM node between {router1} and {router2} in the config')
+        if self.graph.has_edge(router1, router2):
+            raise ValueError(f'the quantum link between {router1} and {router2} already exists')
+        affected = []
+        for source in self._get_tree_sources():
+            lengths, _ = self._get_routing_tree(source)
+            length1 = lengths.get(router1, float('inf'))
+            length2 = lengths.get(router2, float('inf'))
+            if length1 + distance <= length2 or length2 + distance <= length1:  # equal may change the tie-breaking
+                affected.append(source)
+        self.graph.add_edge(router1, router2, weight=distance)
+        return self._update_routing(affected)
+
+    def _get_tree_sources(self) -> list:
+        """the sources of the shortest path trees used by the forwarding tables of the routers,
+           i.e., for each pair, the router with the smaller name
+        """
+        sources = set()
+        for src in self.nodes[self.QUANTUM_ROUTER]:
+            for dst_name in self.graph.nodes:
+                if dst_name != src.name:
+                    sources.add(min(src.name, dst_name))
+        return sorted(sources)
+
+    def _get_routing_tree(self, source: str) -> tuple:
+        """the shortest path tree of source, computed if not kept, e.g., the routing artifacts were loaded from the cache
+        """
+        if source not in self.routing_trees:
+            self.routing_trees[source] = single_source_dijkstra(self.graph, source)
+        return self.routing_trees[source]
+
+    def _update_routing(self, affected: list) -> list:
+        """After the graph changed, recompute the affected shortest path trees,
+           then update the changed next hops in the forwarding tables and the classical delays between the routers.
+           Also, let the controller recompute the probability tables for the new graph and send them to the workers
+
+        Args:
+            affected: the sources of the affected shortest path trees
+        Return:
+            list: the names of the routers whose forwarding table changed
+        """
+        routers = {router.name: router for router in self.nodes[self.QUANTUM_ROUTER]}
+        cchannels = {(cc.sender.name, cc.receiver): cc for cc in self.cchannels}
+        changed = set()
+        for source in affected:
+            self.routing_trees[source] = single_source_dijkstra(self.graph, source)
+            lengths, paths = self.routing_trees[source]
+            for target in self.graph.nodes:
+                if target <= source:
+                    continue
+                path = paths.get(target)
+                for src, dst, next_hop in [(source, target, path[1] if path else None), (target, source, path[-2] if path else None)]:
+                    if src in routers:
+                        routing_protocol = routers[src].network_manager.protocol_stack[0]
+                        forwarding_table = routing_protocol.get_forwarding_table()
+                        if next_hop is None:
+                            if forwarding_table.pop(dst, None) is not None:  # no path anymore
+                                changed.add(src)
+                        elif forwarding_table.get(dst) != next_hop:
+                            routing_protocol.update_forwarding_rule(dst, next_hop)
+                            changed.add(src)
+                    if path:  # if no path, the classical channel keeps its delay
+                        length, hop_count = lengths[target], len(path) - 2
+                        if (src, dst) in cchannels:
+                            cc = cchannels[(src, dst)]
+                            cc.delay, cc.distance = self.classical_delay(length, hop_count), length
+                        if (src, dst) in self.cchannel_specs:  # lazy classical channel not created yet
+                            spec = self.cchannel_specs[(src, dst)]
+                            spec[2], spec[1] = self.classical_delay(length, hop_count), length
+
+        for controller in self.nodes[self.CONTROLLER]:
+            controller.adaptive_continuous.update_graph(self.graph)  # recompute and resend the probability tables
+            controller.dqc_server.reset_cache()
+        return sorted(changed)
+
     def update_stop_time(self, stop_time: int) -> None:
         """Update the stop time
 
@@ -175,3 +474,15 @@ class RouterNetTopoAdaptive(RouterNetTopo):
             assert len(controller_list) == 1, 'There should be one and only one controller'
             controller = controller_list[0]
             controller.graph = self.graph
+            for router in self.nodes[self.QUANTUM_ROUTER]:
+                memory_array = router.get_components_by_type('MemoryArray')[0]
+                controller.memory_sizes[router.name] = len(memory_array)
+
+    def _add_ticker(self):
+        """Create the ticker shared by the nodes, so that the periodic events of the nodes are coalesced
+        """
+        self.ticker = Ticker(self.tl)
+        for controller in self.nodes[self.CONTROLLER]:
+            controller.adaptive_continuous.ticker = self.ticker
+        for router in self.nodes[self.QUANTUM_ROUTER]:
+            router.adaptive_continuous.ticker = self.ticker
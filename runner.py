@@ -39,6 +39,18 @@ def get_output(p: Popen):
             print(line)
 
 
+def run_tasks_fork(tasks: list, parallel: int):
+    '''run the tasks by main.sweep() instead of one python process per task,
+       the topology is built once and every task is a fork of it (warm start)
+
+    Args:
+        tasks: a list of ['python', 'main.py', args...]
+        parallel: the maximum number of tasks running at the same time
+    '''
+    import main
+    main.sweep([task[2:] for task in tasks], parallel)
+
+
 def main_9_13_24():
 
     tasks = []
@@ -353,7 +365,11 @@ def main_11_28_24():
 
 
 # for 200 node as topology
-def main_11_29_24():
+def main_11_29_24(warm_start: bool = False):
+    '''
+    Args:
+        warm_start: if True, run the tasks by run_tasks_fork(), otherwise one python process per task
+    '''
     tasks = []
 
     command = ['python', 'main.py']
@@ -379,6 +395,10 @@ def main_11_29_24():
                     tasks.append(command + args)
 
     parallel = 8
+    if warm_start:
+        run_tasks_fork(tasks, parallel)
+        return
+
     ps = []       # processes current running
     while len(tasks) > 0 or len(ps) > 0:
         if len(ps) < parallel and len(tasks) > 0:
@@ -0,0 +1,76 @@
+'''A shared ticker that runs the periodic (and one-shot) processes of many nodes with one timeline event per tick time
+'''
+
+from heapq import heappush, heappop
+from math import inf
+from typing import TYPE_CHECKING
+
+from sequence.kernel.process import Process
+from sequence.kernel.event import Event
+
+if TYPE_CHECKING:
+    from sequence.kernel.timeline import Timeline
+
+
+class Ticker:
+    '''Coalesce the processes that are due at the same time into a single timeline event.
+       Processes due at the same time run in the order they are registered, so the order is deterministic.
+
+       Usage: ticker.register(Process(owner, 'method', [args]), start_time, period)
+
+       The tick event of a time has the priority of the first process registered at that time,
+       so the processes that would be scheduled with Event(time, process, timeline.schedule_counter) keep their place among the other events
+
+    Attributes:
+        timeline (Timeline): the simulation timeline
+        tasks (list): a heap of (time, order, period, priority, process), period=0 means a one-shot process
+        scheduled_times (set): the times that already have a tick event in the timeline
+        order (int): the registration counter, also the tie breaker of the tasks due at the same time
+    '''
+    def __init__(self, timeline: "Timeline"):
+        self.timeline = timeline
+        self.tasks = []
+        self.scheduled_times = set()
+        self.order = 0
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def register(self, process: Process, start_time: int, period: int = 0, priority: int = inf) -> None:
+        '''register a process
+
+        Args:
+            process: the process to run
+            start_time: the time (ps) of the first run, a time in the past is treated as now
+            period: the process runs again every period (ps), 0 means run only once
+            priority: the priority of the event, used if the tick event at start_time doesn't exist yet
+        '''
+        assert period >= 0
+        start_time = max(start_time, self.timeline.now())
+        heappush(self.tasks, (start_time, self.order, period, priority, process))
+        self.order += 1
+        self.schedule_tick(start_time, priority)
+
+    def schedule_tick(self, time: int, priority: int = inf) -> None:
+        '''make sure there is a tick event at time
+        '''
+        if time not in self.scheduled_times:
+            self.scheduled_times.add(time)
+            process = Process(self, 'tick', [time])
+            event = Event(time, process, priority)
+            self.timeline.schedule(event)
+
+    def tick(self, time: int) -> None:
+        '''run all the processes due at time, and re-register the periodic ones
+
+        Args:
+            time: the time of this tick
+        '''
+        self.scheduled_times.discard(time)
+        while self.tasks and self.tasks[0][0] <= time:
+            _, order, period, priority, process = heappop(self.tasks)
+            process.run()
+            if period > 0:
+                heappush(self.tasks, (time + period, order, period, priority, process))
+        if self.tasks:
+            self.schedule_tick(self.tasks[0][0], self.tasks[0][3])
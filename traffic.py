@@ -1,17 +1,27 @@
 '''generate a traffix matrix and request queue
 '''
 
-from typing import Tuple, List
+from typing import Tuple, List, Iterator
 from itertools import accumulate
 import random
 from bisect import bisect_left
+import numpy as np
 from controller import Controller
 
 from sequence.constants import SECOND, EPSILON
 
 
+# a request in the structured array returned by TrafficMatrix.get_request_array_tts(), src and dst are the router indices
+REQUEST_DTYPE = np.dtype([('id', np.int64), ('src', np.int32), ('dst', np.int32), ('start_time', np.int64), ('end_time', np.int64),
+                          ('memo_size', np.int32), ('fidelity', np.float64), ('entanglement_number', np.int32)])
+
+
 class TrafficMatrix:
-    '''traffic matrix
+    '''traffic matrix, stored sparsely
+
+    Attributes:
+        num_nodes (int): number of nodes
+        matrix (dict): (i, j) -> the probability of a request from router_i to router_j, only the non-zero entries are stored
     '''
     def __init__(self, num_nodes: int):
         self.num_nodes = num_nodes
@@ -19,7 +29,7 @@ class TrafficMatrix:
         self.set_matrix_to_zero()
 
     def set_matrix_to_zero(self):
-        self.matrix = [[0 if i < j else None for j in range(self.num_nodes)] for i in range(self.num_nodes)]
+        self.matrix = {}
 
     def set(self, topology: str, nodes: int, seed: int = None):
         '''set the traffix matrix for runner.py and main.py
@@ -44,14 +54,14 @@ class TrafficMatrix:
     def line_2(self):
         ''' For the line_2.json
         '''
-        self.matrix[0][1] = 1
-        # self.matrix[1][0] = 1
+        self.matrix[0, 1] = 1
+        # self.matrix[1, 0] = 1
 
 
     def line_5(self):
         ''' For the line_5.json
         '''
-        self.matrix[1][3] = 1
+        self.matrix[1, 3] = 1
 
 
     def bottleneck_10(self):
@@ -60,9 +70,9 @@ class TrafficMatrix:
             (3, 9) -- 20%
             (3, 9) -- 30%
         '''
-        self.matrix[2][8] = 0.5
-        self.matrix[3][9] = 0.2
-        self.matrix[3][8] = 0.3
+        self.matrix[2, 8] = 0.5
+        self.matrix[3, 9] = 0.2
+        self.matrix[3, 8] = 0.3
 
     def bottleneck_20(self, seed: int):
         ''' For the bottleneck_20.json
@@ -73,35 +83,35 @@ class TrafficMatrix:
         '''
         self.set_matrix_to_zero()
         if seed == 0:
-            self.matrix[0][11] = 0.25
-            self.matrix[0][12] = 0.25
-            self.matrix[1][11] = 0.25
-            self.matrix[1][12] = 0.25        
+            self.matrix[0, 11] = 0.25
+            self.matrix[0, 12] = 0.25
+            self.matrix[1, 11] = 0.25
+            self.matrix[1, 12] = 0.25        
         if seed == 1:
-            self.matrix[7][18] = 0.25
-            self.matrix[7][19] = 0.25
-            self.matrix[8][18] = 0.25
-            self.matrix[8][19] = 0.25
+            self.matrix[7, 18] = 0.25
+            self.matrix[7, 19] = 0.25
+            self.matrix[8, 18] = 0.25
+            self.matrix[8, 19] = 0.25
         if seed == 2:
-            self.matrix[0][11] = 1
+            self.matrix[0, 11] = 1
     
     def as_20(self):
         '''for autonomous system 20 nodes
         '''
-        self.matrix[10][14] = 1/3
-        self.matrix[13][19] = 1/3
-        self.matrix[11][16] = 1/3
+        self.matrix[10, 14] = 1/3
+        self.matrix[13, 19] = 1/3
+        self.matrix[11, 16] = 1/3
 
 
     def as_100(self):
         '''for autonomous system 100 nodes
         '''
-        self.matrix[53][57] = 1/6
-        self.matrix[33][51] = 1/6
-        self.matrix[57][71] = 1/6
-        self.matrix[48][54] = 1/6
-        self.matrix[73][88] = 1/6
-        self.matrix[53][85] = 1/6
+        self.matrix[53, 57] = 1/6
+        self.matrix[33, 51] = 1/6
+        self.matrix[57, 71] = 1/6
+        self.matrix[48, 54] = 1/6
+        self.matrix[73, 88] = 1/6
+        self.matrix[53, 85] = 1/6
 
 
     def as_200(self, seed):
@@ -109,29 +119,28 @@ class TrafficMatrix:
         '''
         self.set_matrix_to_zero()
         if seed == 0:
-            self.matrix[99][50]   = 1/4
-            self.matrix[148][154] = 1/4
-            self.matrix[189][49]  = 1/4
-            self.matrix[186][98]  = 1/4
+            self.matrix[99, 50]   = 1/4
+            self.matrix[148, 154] = 1/4
+            self.matrix[189, 49]  = 1/4
+            self.matrix[186, 98]  = 1/4
         if seed == 1:
-            self.matrix[176][195] = 1/4
-            self.matrix[199][181] = 1/4
-            self.matrix[79][82]   = 1/4
-            self.matrix[94][160]  = 1/4
+            self.matrix[176, 195] = 1/4
+            self.matrix[199, 181] = 1/4
+            self.matrix[79, 82]   = 1/4
+            self.matrix[94, 160]  = 1/4
         if seed == 2:
-            self.matrix[99][50]   = 1
+            self.matrix[99, 50]   = 1
             
 
     def matrix_to_prob_list(self) -> Tuple[List]:
-        '''convert the traffix matrix into probability list
+        '''convert the traffix matrix into probability list, sorted by (src, dst)
         '''
         src_dst_pairs = []
         prob_list = []
-        for i in range(self.num_nodes):
-            for j in range(self.num_nodes):
-                if self.matrix[i][j] is not None and self.matrix[i][j] > 0:
-                    src_dst_pairs.append((i, j))
-                    prob_list.append(self.matrix[i][j])
+        for (i, j), prob in sorted(self.matrix.items()):
+            if prob > 0:
+                src_dst_pairs.append((i, j))
+                prob_list.append(prob)
         return src_dst_pairs, prob_list
 
 
@@ -196,7 +205,8 @@ class TrafficMatrix:
         assert delta < request_period
 
         # imform the controller the traffix matrix, and start/end time
-        controller.add_traffic(self.matrix, start_time, end_time)
+        if controller is not None:
+            controller.add_traffic(dict(self.matrix), start_time, end_time)
 
         src_dst_pairs, prob_list = self.matrix_to_prob_list()
         prob_accumulate = list(accumulate(prob_list))
@@ -222,3 +232,62 @@ class TrafficMatrix:
             cur_time = request_end_time
 
         return request_queue
+
+
+    def get_request_array_tts(self, request_period: float, delta: float, start_time: float, end_time: float, memo_size: int, \
+                              fidelity: float, entanglement_number: int, seed: int = 0, first_id: int = 0, controller: Controller = None) -> np.ndarray:
+        '''the vectorized version of get_request_queue_tts(), all the requests are generated at once by a numpy Generator.
+           The same seed gives the same requests (but not the same requests as get_request_queue_tts(), which uses the random module)
+
+        Args:
+            request_period: the time period (in seconds) for each request
+            delta: time for EP pre-generation
+            start_time: the start time of the first request in the queue
+            end_time:  the end tme of the last request in the queue
+            memo_size: the memory size for each request
+            fidelity: the fidelity requirement for each request
+            entanglement_number: the number of entanglement needed
+            seed: the random seed
+            first_id: the ID of the first request
+            controller: the centralized controller. assume the controller knows the traffic pattern
+        Return:
+            a structured array of REQUEST_DTYPE, the times are in ps
+        '''
+        assert delta < request_period
+
+        if controller is not None:
+            controller.add_traffic(dict(self.matrix), start_time, end_time)
+
+        src_dst_pairs, prob_list = self.matrix_to_prob_list()
+        # the k-th request is within [start_time + k * request_period, start_time + (k+1) * request_period]
+        max_number = int(np.ceil((end_time - start_time) / request_period)) + 1
+        request_end_times = start_time + request_period * np.arange(1, max_number + 1)
+        number = int(np.count_nonzero(request_end_times <= end_time + EPSILON))
+        request_end_times = request_end_times[:number]
+
+        requests = np.zeros(number, dtype=REQUEST_DTYPE)
+        if number == 0 or not src_dst_pairs:
+            return requests[:0]
+        rng = np.random.default_rng(seed)
+        prob_list = np.array(prob_list)
+        index = rng.choice(len(src_dst_pairs), size=number, p=prob_list / prob_list.sum())
+        src_dst_pairs = np.array(src_dst_pairs, dtype=np.int32)
+        requests['id'] = first_id + np.arange(number)
+        requests['src'] = src_dst_pairs[index, 0]
+        requests['dst'] = src_dst_pairs[index, 1]
+        requests['start_time'] = np.round((request_end_times - request_period + delta) * SECOND)
+        requests['end_time'] = np.round(request_end_times * SECOND)
+        requests['memo_size'] = memo_size
+        requests['fidelity'] = fidelity
+        requests['entanglement_number'] = entanglement_number
+        return requests
+
+
+def request_array_to_queue(requests: np.ndarray) -> Iterator[tuple]:
+    '''iterate over a structured array of requests (see TrafficMatrix.get_request_array_tts()),
+       yield each request as a tuple (id, src name, dst name, start time, end time, memory size, fidelity, entanglement number),
+       the same as the requests in the queue returned by TrafficMatrix.get_request_queue_tts()
+    '''
+    for request in requests.tolist():
+        id, src, dst, start_time, end_time, memo_size, fidelity, entanglement_number = request
+        yield (id, f'router_{src}', f'router_{dst}', start_time, end_time, memo_size, fidelity, entanglement_number)